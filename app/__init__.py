@@ -1,67 +1,94 @@
 from pyglet.app import run
 from pyglet.graphics import Batch
 from pyglet.window import Window
-from secrets import choice
+
+import numpy as np
 
 from constants import (
     WIDTH,
     HEIGHT,
     CAPTION,
+    FRAME_INTERVAL,
+    STEP_INTERVAL,
     VALUES_PATH,
     VALUES_SHEETNAMES,
+    CACHE_DIRECTORY,
     FACILITIES,
     IMAGE_DATA,
     RESOLUTION,
+    SEED,
     ATTACK_DIRECTIONS,
     DIRECTIONS_PATH,
     DIRECTIONS_SHEET,
 )
-from library import PROPAGATION_STYLE_CHOICES
-from utils import (
+from library.simulation import Simulation
+from library.view import (
+    View,
     center,
+)
+from utils import (
     initialize,
-    parse_xlsx,
     get_directions,
 )
-
-import sys
-
-sys.setrecursionlimit(int(1e9))
+from utils.workbook import load_parameters
 
 window = Window(width=WIDTH, height=HEIGHT,)
 window.set_caption(caption=CAPTION)
 center(window)
 
-paused = True
 batch = Batch()
 grid, named_maps = initialize(
-    facility_variables=parse_xlsx(VALUES_PATH, *VALUES_SHEETNAMES),
+    facility_parameters=load_parameters(
+        workbook_path=VALUES_PATH,
+        sheetnames=VALUES_SHEETNAMES,
+        cache_directory=CACHE_DIRECTORY,
+    ),
     facilities=FACILITIES,
     image_data=IMAGE_DATA,
     resolution=RESOLUTION,
+    cache_directory=CACHE_DIRECTORY,
+    rng=np.random.default_rng(SEED),
+)
+view = View(
+    owners=grid.owners,
+    colors=[facility.color for facility in grid.facilities],
+    resolution=RESOLUTION,
     height=HEIGHT,
     batch=batch,
 )
 
-directions = get_directions(DIRECTIONS_PATH, DIRECTIONS_SHEET, len(grid.values[0]), len(grid.values))
+directions = get_directions(
+    DIRECTIONS_PATH,
+    DIRECTIONS_SHEET,
+    grid.owners.shape[1],
+    grid.owners.shape[0],
+    RESOLUTION,
+    cache_directory=CACHE_DIRECTORY,
+)
+
+simulation = Simulation(
+    grid=grid,
+    directions=directions,
+    attack_directions=ATTACK_DIRECTIONS,
+    interval=STEP_INTERVAL,
+    on_step=lambda snapshot: print(snapshot.score),
+)
 
 @window.event
 def on_key_press(symbol, modifier):
-    global paused
-    paused = not paused
+    simulation.toggle()
 
 @window.event
 def on_draw():
     window.clear()
-    if not paused:
-        grid.update(
-            named_maps=named_maps,
-            attack_directions=ATTACK_DIRECTIONS,
-            facilities=FACILITIES,
-            directions=directions,
-            style=choice(PROPAGATION_STYLE_CHOICES)
-        )
+    view.show(simulation.snapshot.owners)
+    view.refresh()
     batch.draw()
 
+@window.event
+def on_close():
+    simulation.stop()
+
 if __name__  == '__main__':
-    run()
+    simulation.start()
+    run(FRAME_INTERVAL)
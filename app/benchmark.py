@@ -0,0 +1,341 @@
+'''
+Times the engine on synthetic maps and facility tables, written out as
+images and a workbook in a temporary directory so startup goes through
+the real loaders and caches, e.g.
+
+    python benchmark.py --sizes 1000x822 2000x1644 --resolutions 20 10 --out report.json
+'''
+from argparse import ArgumentParser
+from itertools import count
+from json import dumps
+from os import path
+from platform import platform, python_version
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+from openpyxl import Workbook
+from PIL import Image
+
+from constants import (
+    IMAGE_NAMES,
+    ATTACK_DIRECTIONS,
+)
+from library import (
+    Facility,
+    Grid,
+)
+from library.components import (
+    ComponentTable,
+    label_components,
+)
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.directions import Directions
+from library.scoring import (
+    PARAMETER_NAMES,
+    PRECISIONS,
+    score_raster,
+)
+from utils import (
+    assign_parameters,
+    load_named_maps,
+)
+from utils.workbook import (
+    FacilityParameters,
+    load_parameters,
+)
+
+SHEETNAME = 'facilities'
+
+# Ranges the synthetic parameters are drawn from, roughly those of the
+# values workbook.
+PARAMETER_RANGES = {
+    'short_term_wages': (40000, 70000),
+    'short_term_workers': (1, 5),
+    'long_term_wages': (30000, 40000),
+    'long_term_workers': (1, 5),
+    'solar_reduction': (5, 15),
+    'average_revenue': (0.01, 50),
+    'percent_solar': (0, 1),
+    'accessibility_factor': (30, 170),
+    'irrigation_factor': (0, 1),
+    'constant': (0, 0.1),
+    'construction_factor': (0.4, 600),
+    'deforestation_factor': (900, 1500),
+    'operating_costs': (0.01, 8),
+    'utility_costs': (0.001, 2),
+    'taxation_factor': (1e-7, 1e-6),
+    'upper_carbon_limit': (100, 130),
+    'carbon_produced': (0.002, 2.5),
+}
+
+def synthetic_maps(
+    width: int,
+    height: int,
+    rng: np.random.Generator,
+):
+    '''
+    Smooth random layers of `height` x `width` pixels, zero outside of an
+    elliptical map area, like the bands of the real map images.
+    '''
+    ys, xs = np.mgrid[0:height, 0:width]
+    inside = ((ys - height / 2) / (0.45 * height)) ** 2 + ((xs - width / 2) / (0.45 * width)) ** 2 <= 1
+    named_maps = {}
+    for name in IMAGE_NAMES:
+        coarse = rng.random((height // 50 + 2, width // 50 + 2))
+        layer = coarse[ys // 50, xs // 50] * 192 + rng.random((height, width)) * 63 + 1
+        named_maps[name] = np.where(inside, layer, 0).astype(np.uint8)
+    return named_maps
+
+def synthetic_parameters(
+    facility_count: int,
+    rng: np.random.Generator,
+):
+    names = tuple(f'Facility {i}' for i in range(facility_count))
+    return FacilityParameters(
+        names=names,
+        columns=dict(
+            (name, rng.uniform(*PARAMETER_RANGES[name], size=facility_count))
+            for name in PARAMETER_NAMES
+        ),
+    )
+
+def synthetic_directions(
+    width: int,
+    height: int,
+    rng: np.random.Generator,
+):
+    return Directions(
+        ids=rng.integers(len(ATTACK_DIRECTIONS), size=(height, width), dtype=np.uint8),
+        labels=tuple(ATTACK_DIRECTIONS),
+    )
+
+def write_inputs(
+    directory: str,
+    named_maps: dict[str, np.ndarray],
+    parameters: FacilityParameters,
+):
+    '''
+    Writes every map as a greyscale PNG and the parameters as a one-sheet
+    workbook under `directory`, returning the image data and the workbook
+    path to load them back from.
+    '''
+    image_data = []
+    for name, layer in named_maps.items():
+        image_path = path.join(directory, f'{name}.png')
+        Image.fromarray(layer, mode='L').save(image_path)
+        image_data.append((image_path, 0, name))
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = SHEETNAME
+    sheet.append(('name', *parameters.columns))
+    for i, name in enumerate(parameters.names):
+        sheet.append((name, *(float(column[i]) for column in parameters.columns.values())))
+    workbook_path = path.join(directory, 'values.xlsx')
+    workbook.save(workbook_path)
+    return tuple(image_data), workbook_path
+
+def timed(function: Callable, repeats: int):
+    times = []
+    for _ in range(repeats):
+        started = perf_counter()
+        result = function()
+        times.append(perf_counter() - started)
+    return result, dict(min=min(times), median=median(times), repeats=repeats)
+
+def benchmark(
+    width: int,
+    height: int,
+    resolution: int,
+    facility_count: int,
+    mode: str,
+    precision: str,
+    repeats: int,
+    seed: int,
+):
+    dtype = PRECISIONS[precision]
+    rng = np.random.default_rng(seed)
+    named_maps = synthetic_maps(width, height, rng)
+    parameters = synthetic_parameters(facility_count, rng)
+    facilities = tuple(
+        Facility(name=name, color=tuple(int(value) for value in rng.integers(256, size=3)))
+        for name in parameters.names
+    )
+    timings = {}
+    directory = TemporaryDirectory()
+    image_data, workbook_path = write_inputs(directory.name, named_maps, parameters)
+    cache_directories = (path.join(directory.name, f'cache-{i}') for i in count())
+
+    def startup(cache_directory):
+        sampled = load_named_maps(
+            image_data=image_data,
+            resolution=resolution,
+            cache_directory=cache_directory,
+        )
+        assign_parameters(
+            facilities,
+            load_parameters(
+                workbook_path=workbook_path,
+                sheetnames=(SHEETNAME,),
+                cache_directory=cache_directory,
+            ),
+        )
+        return sampled
+
+    # Uncached decodes the inputs every time, cold fills a new cache
+    # every time and warm reads the cache the cold runs left behind.
+    _, timings['startup_uncached'] = timed(lambda: startup(None), repeats)
+    _, timings['startup_cold'] = timed(lambda: startup(next(cache_directories)), repeats)
+    warm = path.join(directory.name, 'cache-0')
+    sampled, timings['startup_warm'] = timed(lambda: startup(warm), repeats)
+    mask = np.logical_or.reduce([layer != 0 for layer in sampled.values()])
+    directions = synthetic_directions(mask.shape[1], mask.shape[0], rng)
+
+    grid, timings['initialization'] = timed(
+        lambda: Grid(
+            named_maps=sampled,
+            mask=mask,
+            facilities=facilities,
+            rng=np.random.default_rng(seed),
+            dtype=dtype,
+        ),
+        repeats,
+    )
+
+    def update():
+        return grid.update(
+            attack_directions=ATTACK_DIRECTIONS,
+            directions=directions,
+            style=int(grid.rng.choice(PROPAGATION_STYLE_CHOICES)),
+            synchronous=mode == 'synchronous',
+            incremental=mode == 'incremental',
+        )
+
+    def component_table(owners):
+        return ComponentTable(
+            owners=owners,
+            topography=grid.layers['topography'],
+            directions=directions.ids,
+            direction_count=len(directions.labels),
+        )
+
+    def relabelling(previous, owners, suffix):
+        # A step's flips applied to the components it started from, both
+        # incrementally and by building the table anew.
+        changed = np.nonzero(previous != owners)
+        tables = iter([component_table(previous) for _ in range(repeats)])
+        _, timings[f'components_incremental{suffix}'] = timed(
+            lambda: next(tables).reassign(owners, *changed),
+            repeats,
+        )
+        _, timings[f'components_fresh{suffix}'] = timed(lambda: component_table(owners), repeats)
+        return int(changed[0].size)
+
+    initial = grid.owners.copy()
+    _, timings['first_update'] = timed(update, 1)
+    first_flips = relabelling(initial, grid.owners.copy(), '_first')
+    _, timings['update'] = timed(update, repeats)
+    update_phases = grid.profiler.last['phases']
+    components = grid.components
+    _, timings['scoring'] = timed(
+        lambda: score_raster(
+            table=grid.table,
+            layers=grid.layers,
+            area=components.area[components.labels],
+            average_topography=components.average_topography[components.labels],
+            dtype=dtype,
+        ),
+        repeats,
+    )
+    _, timings['labelling'] = timed(lambda: label_components(grid.owners), repeats)
+    previous = grid.owners.copy()
+    update()
+    flips = relabelling(previous, grid.owners, '')
+
+    del sampled, grid
+    directory.cleanup()
+    return dict(
+        width=width,
+        height=height,
+        resolution=resolution,
+        rows=mask.shape[0],
+        columns=mask.shape[1],
+        cells=int(mask.sum()),
+        first_flips=first_flips,
+        flips=flips,
+        facilities=facility_count,
+        mode=mode,
+        precision=precision,
+        seconds=timings,
+        update_phases=update_phases,
+    )
+
+def parse_size(value: str):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description='Benchmark the engine on synthetic inputs.')
+    parser.add_argument(
+        '--sizes',
+        type=parse_size,
+        nargs='+',
+        default=[(1000, 822)],
+        help='map sizes in pixels, WxH',
+    )
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[20, 10])
+    parser.add_argument('--facilities', type=int, default=8)
+    parser.add_argument(
+        '--modes',
+        nargs='+',
+        choices=('sweep', 'synchronous', 'incremental'),
+        default=['synchronous', 'incremental'],
+    )
+    parser.add_argument(
+        '--precisions',
+        nargs='+',
+        choices=tuple(PRECISIONS),
+        default=['float64'],
+    )
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='.json file to write the report to')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    results = []
+    for width, height in arguments.sizes:
+        for resolution in arguments.resolutions:
+            for mode in arguments.modes:
+                for precision in arguments.precisions:
+                    results.append(benchmark(
+                        width=width,
+                        height=height,
+                        resolution=resolution,
+                        facility_count=arguments.facilities,
+                        mode=mode,
+                        precision=precision,
+                        repeats=arguments.repeats,
+                        seed=arguments.seed,
+                    ))
+                    print(*(
+                        f'{key}={value}' for key, value in results[-1].items() if key not in ('seconds', 'update_phases')
+                    ), *(
+                        f'{phase}={timing["median"]:.6f}' for phase, timing in results[-1]['seconds'].items()
+                    ))
+    report = dict(
+        python=python_version(),
+        numpy=np.__version__,
+        platform=platform(),
+        seed=arguments.seed,
+        results=results,
+    )
+    if arguments.out:
+        with open(arguments.out, 'w') as file:
+            file.write(dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,20 @@ HEIGHT = 822
 
 RESOLUTION = 20  # Must be in multiples of 10
 
+SEED = None  # Fixed integer for reproducible runs
+
 CAPTION = 'IMMC 2023 Prototype'
 
+FRAME_INTERVAL = 1 / 60
+STEP_INTERVAL = 0  # Minimum seconds between steps
+
 INPUT_DIRECTORY = 'input'
 IMAGE_DIRECTORY = 'img'
+CACHE_DIRECTORY = 'cache'
 
 DIRECTIONS_PATH = f'{INPUT_DIRECTORY}/directions.xlsx'
 DIRECTIONS_SHEET = 'main'
+DIRECTIONS_RESOLUTION = 10  # Pixels per cell of the directions sheet
 
 IMAGE_NAMES = (
     'topography',
@@ -0,0 +1,207 @@
+'''
+Runs many independent headless simulations over a process pool and
+aggregates their outcomes, e.g.
+
+    python ensemble.py --runs 200 --styles 0 1 2 3 mixed --out ensemble.npz
+'''
+from argparse import ArgumentParser
+from itertools import product
+from multiprocessing import Pool
+from os import cpu_count
+
+import numpy as np
+
+from constants import (
+    VALUES_PATH,
+    VALUES_SHEETNAMES,
+    CACHE_DIRECTORY,
+    FACILITIES,
+    IMAGE_DATA,
+    RESOLUTION,
+    DIRECTIONS_PATH,
+    DIRECTIONS_SHEET,
+)
+from headless import (
+    MIXED,
+    Outcome,
+    Task,
+    attach,
+    run,
+)
+from library.components import EMPTY
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.store import publish
+from utils import (
+    initialize,
+    get_directions,
+)
+from utils.workbook import load_parameters
+
+class Ensemble:
+    '''
+    Running aggregate of ensemble outcomes: how often every facility ends
+    up owning every cell, and the final score, step count and convergence
+    of every run.
+    '''
+    def __init__(self, facility_count: int, shape: tuple[int, int]):
+        self.ownership = np.zeros((facility_count, *shape), dtype=np.int32)
+        self.seeds: list[int] = []
+        self.styles: list[int] = []
+        self.steps: list[int] = []
+        self.converged: list[bool] = []
+        self.scores: list[float] = []
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def add(self, outcome: Outcome):
+        ys, xs = np.nonzero(outcome.owners != EMPTY)
+        np.add.at(self.ownership, (outcome.owners[ys, xs], ys, xs), 1)
+        self.seeds.append(outcome.task.seed)
+        self.styles.append(outcome.task.style)
+        self.steps.append(outcome.steps)
+        self.converged.append(outcome.converged)
+        self.scores.append(outcome.score)
+
+    @property
+    def frequencies(self):
+        return self.ownership / max(1, len(self))
+
+    def style_statistics(self):
+        styles = np.array(self.styles)
+        steps = np.array(self.steps)
+        converged = np.array(self.converged)
+        scores = np.array(self.scores)
+        statistics = {}
+        for style in dict.fromkeys(self.styles):
+            runs = styles == style
+            statistics[style] = dict(
+                runs=int(runs.sum()),
+                converged=float(converged[runs].mean()),
+                steps=float(steps[runs & converged].mean()) if (runs & converged).any() else None,
+                score_mean=float(scores[runs].mean()),
+                score_std=float(scores[runs].std()),
+            )
+        return statistics
+
+    def save(self, path: str, facility_names: tuple[str, ...]):
+        np.savez_compressed(
+            path,
+            facilities=np.array(facility_names),
+            frequencies=self.frequencies,
+            seeds=np.array(self.seeds),
+            styles=np.array(self.styles),
+            steps=np.array(self.steps),
+            converged=np.array(self.converged),
+            scores=np.array(self.scores),
+        )
+
+def parse_style(value: str):
+    return MIXED if value == 'mixed' else int(value)
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description='Run an ensemble of headless simulations.')
+    parser.add_argument('--runs', type=int, default=100, help='seeds per style')
+    parser.add_argument('--seed', type=int, default=0, help='first seed; runs use consecutive seeds')
+    parser.add_argument(
+        '--styles',
+        type=parse_style,
+        nargs='+',
+        default=[MIXED],
+        help="propagation styles to run, 'mixed' for a random one per step",
+    )
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--resolution', type=int, default=RESOLUTION)
+    parser.add_argument('--processes', type=int, default=cpu_count())
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--flip-threshold', type=int, default=0)
+    parser.add_argument('--score-threshold', type=float, default=None)
+    parser.add_argument('--patience', type=int, default=len(PROPAGATION_STYLE_CHOICES))
+    parser.add_argument('--out', default=None, help='.npz file to write the aggregate to')
+    parser.add_argument(
+        '--save-every',
+        type=int,
+        default=0,
+        help='also write the aggregate after every this many runs',
+    )
+    parser.add_argument('--quiet', action='store_true')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    for style in arguments.styles:
+        if style != MIXED and style not in PROPAGATION_STYLE_CHOICES:
+            raise ValueError(f'Unknown propagation style {style}')
+    tasks = [
+        Task(
+            seed=seed,
+            style=style,
+            steps=arguments.steps,
+            flip_threshold=arguments.flip_threshold,
+            score_threshold=arguments.score_threshold,
+            patience=arguments.patience,
+            incremental=arguments.incremental,
+        )
+        for style, seed in product(
+            arguments.styles,
+            range(arguments.seed, arguments.seed + arguments.runs),
+        )
+    ]
+    facility_names = tuple(facility.name for facility in FACILITIES)
+
+    grid, _ = initialize(
+        facility_parameters=load_parameters(
+            workbook_path=VALUES_PATH,
+            sheetnames=VALUES_SHEETNAMES,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+        facilities=FACILITIES,
+        image_data=IMAGE_DATA,
+        resolution=arguments.resolution,
+        cache_directory=CACHE_DIRECTORY,
+    )
+    store = publish(
+        layers=grid.layers,
+        mask=grid.owners != EMPTY,
+        directions=get_directions(
+            DIRECTIONS_PATH,
+            DIRECTIONS_SHEET,
+            grid.owners.shape[1],
+            grid.owners.shape[0],
+            arguments.resolution,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+        facilities=grid.facilities,
+    )
+
+    ensemble = None
+    with store, Pool(
+        arguments.processes,
+        initializer=attach,
+        initargs=(store.spec,),
+    ) as pool:
+        for outcome in pool.imap_unordered(run, tasks):
+            if ensemble is None:
+                ensemble = Ensemble(len(FACILITIES), outcome.owners.shape)
+            ensemble.add(outcome)
+            if not arguments.quiet:
+                print(
+                    len(ensemble),
+                    outcome.task.seed,
+                    'mixed' if outcome.task.style == MIXED else outcome.task.style,
+                    outcome.steps,
+                    outcome.converged,
+                    outcome.score,
+                )
+            if arguments.out and arguments.save_every and len(ensemble) % arguments.save_every == 0:
+                ensemble.save(arguments.out, facility_names)
+
+    if ensemble is None:
+        return
+    for style, statistics in ensemble.style_statistics().items():
+        print('mixed' if style == MIXED else style, *(f'{key}={value}' for key, value in statistics.items()))
+    if arguments.out:
+        ensemble.save(arguments.out, facility_names)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+Pool workers shared by the scripts that run many headless simulations
+over the layers published by library.store, like ensemble.py and
+sweep.py. Start the pool with `attach` as its initializer and map `run`
+over Tasks.
+'''
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+
+from library import Grid
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.convergence import Convergence
+from library.scoring import FacilityTable
+from library.store import attach_layers
+from run import simulate
+
+# Style label of runs that pick a random style every step.
+MIXED = -1
+
+class Task(NamedTuple):
+    seed: int
+    style: int
+    steps: int
+    flip_threshold: int
+    score_threshold: Optional[float]
+    patience: int
+    incremental: bool
+    # Parameters to score with in place of the published facilities' own.
+    table: Optional[FacilityTable] = None
+    # Passed back with the outcome, to tell runs apart.
+    tag: Any = None
+
+class Outcome(NamedTuple):
+    task: Task
+    steps: int
+    converged: bool
+    score: float
+    owners: np.ndarray
+
+_state = {}
+
+def attach(spec: tuple):
+    # Pool initializer: workers map the layers, mask, directions and
+    # parameter table published by the parent instead of loading them.
+    _state['published'] = attach_layers(spec)
+
+def run(task: Task):
+    published = _state['published']
+    grid = Grid(
+        named_maps=None,
+        mask=published.mask,
+        facilities=published.facilities,
+        rng=np.random.default_rng(task.seed),
+        layers=published.layers,
+        table=task.table,
+    )
+    convergence = Convergence(
+        flips=task.flip_threshold,
+        score=task.score_threshold,
+        patience=task.patience,
+    )
+    history = list(simulate(
+        grid=grid,
+        directions=published.directions,
+        styles=(
+            int(grid.rng.choice(PROPAGATION_STYLE_CHOICES)) if task.style == MIXED else task.style
+            for _ in range(task.steps)
+        ),
+        convergence=convergence,
+        synchronous=True,
+        incremental=task.incremental,
+    ))
+    return Outcome(
+        task=task,
+        steps=len(history),
+        converged=convergence.converged,
+        score=history[-1][1] if history else float('nan'),
+        owners=grid.owners,
+    )
@@ -1,10 +1,8 @@
-from collections import defaultdict
 from decimal import Decimal
 from math import log
-from pyglet.graphics import Batch
-from pyglet.shapes import Rectangle as PygletRectangle
-from secrets import randbelow
-from typing import Any, Iterable, Optional
+from typing import Iterable, Optional
+
+import numpy as np
 
 from .constants import (
     SHORT_TERM_DURATION,
@@ -18,6 +16,7 @@ from .constants import (
     ADVANTAGE,
     MAX_COLOR_VALUE,
     INFLUX_EFFECT,
+    PROPAGATION_STYLE_CHOICES,
     _0,
     _1,
     _2,
@@ -28,6 +27,30 @@ from .constants import (
     _100,
     _neg_1,
 )
+from .components import (
+    EMPTY,
+    OWNER_DTYPE,
+    ComponentTable,
+)
+from .directions import Directions
+from .parallel import StripePool
+from .profiling import Profiler
+from .propagation import (
+    POSITIONS,
+    cell_scores,
+    dilate,
+    frontier,
+    propagate,
+    propagate_at,
+    sweep,
+)
+from .scoring import (
+    PARAMETER_NAMES,
+    FacilityTable,
+    as_layers,
+    score_cells,
+    score_raster,
+)
 
 def ln(value: Decimal):
     return Decimal(log(value))
@@ -36,6 +59,8 @@ def color_code_to_value(value: Decimal):
     return value * _100 / MAX_COLOR_VALUE
 
 class Facility:
+    __slots__ = ('name', 'color', *PARAMETER_NAMES)
+
     name: str
     color: tuple[int, int, int]
 
@@ -43,16 +68,6 @@ class Facility:
         self.name = kwargs['name']
         self.color = kwargs['color']
 
-    def average(
-            self,
-            map: list[list[Any]],
-            connected_cells: Iterable[tuple[int, int]]
-    ):
-        return sum(
-            map[y][x] * _100 / MAX_COLOR_VALUE
-            for x, y in connected_cells 
-        ) / len(connected_cells)
-        
     def short_term_benefits(self):
         return self.short_term_wages * self.short_term_workers
     
@@ -126,10 +141,11 @@ class Facility:
         named_maps: dict[str, list[list[int]]],
         x: int,
         y: int,
-        connected_cells: Iterable[tuple[int, int]] | None,
+        area: Decimal | None,
+        average_topography: Decimal | None,
     ):
-        area = Decimal(len(connected_cells)) if connected_cells is not None else _1
-        average_topography = self.average_topography if connected_cells is not None else _1
+        average_topography = average_topography if area is not None else _1
+        area = area if area is not None else _1
         return area * self.construction_factor * (
             _1 - abs(
                 _1 - self.constant * color_code_to_value(named_maps['topography'][y][x]) / average_topography
@@ -141,7 +157,8 @@ class Facility:
 
     def short_term_costs(
         self,
-        connected_cells: Iterable[tuple[int, int]] | None,
+        area: Decimal | None,
+        average_topography: Decimal | None,
         named_maps: dict[str, list[list[int]]],
         x: int,
         y: int,
@@ -163,32 +180,32 @@ class Facility:
                 named_maps=named_maps,
                 x=x,
                 y=y,
-                connected_cells=connected_cells,
+                area=area,
+                average_topography=average_topography,
             ) + self.labor_price()
         )
     
     def carbon_taxation(
         self,
-        connected_cells: Iterable[tuple[int, int]] | None,
+        area: Decimal | None,
     ):
-        area = Decimal(len(connected_cells)) if connected_cells is not None else _1
+        area = area if area is not None else _1
         return area * self.taxation_factor * max(_0, self.carbon_produced - self.upper_carbon_limit)
     
     def long_term_costs(
         self,
-        connected_cells: Iterable[tuple[int, int]] | None,
+        area: Decimal | None,
     ):
         return self.operating_costs + self.utility_costs + self.carbon_taxation(
-            connected_cells=connected_cells
+            area=area
         )
 
     def ldmr_multiplier(
         self,
-        connected_cells: Iterable[tuple[int, int]] | None,
+        area: Decimal | None,
     ):
-        if connected_cells is None:
+        if area is None:
             return _1
-        area = Decimal(len(connected_cells))
         if area < MINIMUM_AREA:
             return pow(
                 base=_e,
@@ -209,7 +226,8 @@ class Facility:
         named_maps: dict[str, list[list[int]]],
         x: int,
         y: int,
-        connected_cells: Optional[Iterable[tuple[int, int]]] = None,
+        area: Optional[Decimal] = None,
+        average_topography: Optional[Decimal] = None,
     ):
         return (
             (
@@ -225,230 +243,325 @@ class Facility:
                     named_maps=named_maps,
                     x=x,
                     y=y,
-                    connected_cells=connected_cells,
+                    area=area,
+                    average_topography=average_topography,
                 ) * SHORT_TERM_DURATION
                 + self.long_term_costs(
-                    connected_cells=connected_cells
+                    area=area
                 ) * LONG_TERM_DURATION
             ) * self.ldmr_multiplier(
-                connected_cells=connected_cells
+                area=area
             )
         )
 
-class Rectangle(PygletRectangle):
-    facility: Facility
-    connected_cells: Iterable[tuple[int, int]]
-
-    def __init__(self, **kwargs):
-        self.facility = kwargs.pop('facility')
-        super().__init__(**kwargs)
-
-def valid(x: int, y: int, grid: list):
-    return all([
-        0 <= x < len(grid[0]),
-        0 <= y < len(grid),
-    ]) and grid[y][x]
+def candidates(facilities: tuple[Facility, ...]):
+    '''
+    Indices of the facilities that may own cells, i.e. those not in
+    BLACKLIST.
+    '''
+    indices = np.array(
+        [i for i, facility in enumerate(facilities) if facility.name not in BLACKLIST],
+        dtype=np.int64,
+    )
+    if not indices.size:
+        raise ValueError(
+            f'Every one of the {len(facilities)} facilities is in BLACKLIST; '
+            'leave at least one out of it to place'
+        )
+    return indices
 
-def neighbors(x: int, y: int, grid: list[list[Any]]):
-    for dx in (-1, 0, 1):
-        for dy in (-1, 0, 1):
-            if valid(x + dx, y + dy, grid):
-                yield (x + dx, y + dy)
+def initial_owners(
+    facilities: tuple[Facility, ...],
+    layers: dict[str, np.ndarray],
+    mask: np.ndarray,
+    rng: np.random.Generator,
+    dtype: np.dtype = np.float64,
+    table: Optional[FacilityTable] = None,
+):
+    '''
+    Owners of the cells in `mask` before the first step: the facility
+    with the highest random draw or, without RANDOMIZED_INITIAL_GRID, the
+    highest score, among the facilities not in BLACKLIST. Scores come
+    from `table` if given, else from the facilities' own parameters.
+    Draws are taken cell by cell in row-major order, so drawing the rows
+    of a grid in several calls gives the same owners as one call.
+    '''
+    indices = candidates(facilities)
+    ys, xs = np.nonzero(mask)
+    if RANDOMIZED_INITIAL_GRID:
+        initial_scores = rng.integers(100, size=(ys.size, indices.size)).T
+    else:
+        initial_scores = score_raster(
+            table=(FacilityTable.from_facilities(facilities) if table is None else table).take(indices),
+            layers=layers,
+            dtype=dtype,
+        )[:, ys, xs]
+    owners = np.full(mask.shape, EMPTY, dtype=OWNER_DTYPE)
+    owners[ys, xs] = indices[initial_scores.argmax(axis=0)]
+    return owners
 
 class Grid:
-    values: list[list[Rectangle | None]]
+    owners: np.ndarray
+    components: ComponentTable | None
+    changed: tuple[np.ndarray, np.ndarray]
+    preferred_direction: tuple[str, ...]
 
     def __init__(
         self,
-        named_maps: dict[str, list[list[int]]],
-        merged_map: list[list[dict[str, int]]],
+        named_maps: Optional[dict[str, np.ndarray]],
+        mask: np.ndarray,
         facilities: Iterable[Facility],
-        resolution: int,
-        batch: Batch,
-        height: int,
+        rng: Optional[np.random.Generator] = None,
+        profiler: Optional[Profiler] = None,
+        layers: Optional[dict[str, np.ndarray]] = None,
+        dtype: np.dtype = np.float64,
+        table: Optional[FacilityTable] = None,
+        area_scale: float = 1.0,
     ):
-        self.values = [[None for _ in row] for row in merged_map]
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if any(merged_map[y][x].values()):
-                    best_facility = None
-                    best_score = -1
-                    for facility in facilities:
-                        if facility.name in BLACKLIST:
-                            continue
-                        score = randbelow(100) if RANDOMIZED_INITIAL_GRID else facility.score(
-                            named_maps=named_maps,
-                            x=x,
-                            y=y,
-                        )
-                        if score > best_score:
-                            best_facility = facility
-                            best_score = score
-                    self.values[y][x] = Rectangle(
-                        x=x * resolution,
-                        y=height - y * resolution,
-                        width=resolution,
-                        height=resolution,
-                        color=best_facility.color,
-                        batch=batch,
-                        facility=best_facility,
-                    )
-    
-    def clear_connected_cell_data(self):
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if self.values[y][x]:
-                    self.values[y][x].connected_cells = None
+        # `layers` may be given in place of `named_maps` when they were
+        # already converted, e.g. attached from a shared layer store.
+        # Scoring runs in `dtype`, one of scoring.PRECISIONS, and with
+        # `table` in place of the facilities' own parameters if given.
+        # Region areas are scored as `area_scale` cells per cell, so a
+        # coarse grid can be scored in the cells of a finer one.
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.profiler = Profiler() if profiler is None else profiler
+        self.facilities = tuple(facilities)
+        if len(self.facilities) > np.iinfo(OWNER_DTYPE).max:
+            raise ValueError(f'At most {np.iinfo(OWNER_DTYPE).max} facilities are supported')
+        self.table = FacilityTable.from_facilities(self.facilities) if table is None else table
+        if len(self.table) != len(self.facilities):
+            raise ValueError(f'Expected a table of {len(self.facilities)} facilities, got {len(self.table)}')
+        self.dtype = np.dtype(dtype)
+        self.area_scale = area_scale
+        self.layers = as_layers(named_maps, self.dtype) if layers is None else dict(
+            (name, layer.astype(self.dtype, copy=False)) for name, layer in layers.items()
+        )
+        self.owners = initial_owners(
+            facilities=self.facilities,
+            layers=self.layers,
+            mask=mask,
+            rng=self.rng,
+            dtype=self.dtype,
+            table=self.table,
+        )
+        self.components = None
+        self.changed = np.nonzero(np.zeros(self.owners.shape, dtype=bool))
+        self.cell_scores = None
+
+    @property
+    def flips(self):
+        return len(self.changed[0])
+
+    @property
+    def region_area(self):
+        return self.components.area * self.area_scale
+
+    def load_owners(self, owners: np.ndarray):
+        '''
+        Replaces the owners, e.g. from a checkpoint, dropping the state
+        derived from the old ones; the next update rebuilds it.
+        '''
+        if owners.shape != self.owners.shape:
+            raise ValueError(f'Expected owners of shape {self.owners.shape}, got {owners.shape}')
+        self.owners = np.array(owners, dtype=OWNER_DTYPE)
+        self.components = None
+        self.changed = np.nonzero(np.zeros(self.owners.shape, dtype=bool))
+        self.cell_scores = None
 
     def set_connected_cell_data(
         self,
-        named_maps: dict[str, list[list[int]]],
+        directions: Directions,
     ):
-        def bfs_(
-            connected_component: set,
-            x: int,
-            y: int,
-        ):
-            connected_component.add((x, y))
-            for dx, dy in (
-                (1, 0),
-                (0, 1),
-                (-1, 0),
-                (0, -1)
-            ):
-                u = x + dx
-                v = y + dy
-                if valid(u, v, self.values):
-                    if all([
-                        (u, v) not in connected_component,
-                        self.values[v][u].facility == self.values[y][x].facility,
-                    ]):
-                        bfs_(connected_component, u, v)
-
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if self.values[y][x]:
-                    if getattr(self.values[y][x], 'connected_cells', None) is None:
-                        connected_component = set()
-                        bfs_(connected_component, x, y)
-                        connected_component = tuple(connected_component)
-                        average_topography = self.values[y][x].facility.average(
-                            map=named_maps['topography'],
-                            connected_cells=connected_component
-                        )
-                        for u, v in connected_component:
-                            setattr(self.values[v][u], 'connected_cells', connected_component)
-                            setattr(self.values[v][u].facility, 'average_topography', average_topography)
+        if self.components is None:
+            self.components = ComponentTable(
+                owners=self.owners,
+                topography=self.layers['topography'],
+                directions=directions.ids,
+                direction_count=len(directions.labels),
+            )
+            return None
+        _, added = self.components.reassign(self.owners, *self.changed)
+        return added
 
     def get_preferred_direction(
         self,
-        facilities: Iterable[Facility],
-        directions: dict[str, set],
+        directions: Directions,
     ):
-        seen = set()
-        record = dict((facility, defaultdict(int)) for facility in facilities)
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if self.values[y][x] and (x, y) not in seen:
-                    seen.update(self.values[y][x].connected_cells)
-                    for u, v in self.values[y][x].connected_cells:
-                        for direction, group in directions.items():
-                            if (u, v) in group:
-                                record[self.values[v][u].facility][direction] += 1
-                                break
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if self.values[y][x]:
-                    self.values[y][x].preferred_direction = max(
-                        record[self.values[y][x].facility],
-                        key=lambda direction: record[self.values[y][x].facility][direction]
-                    )
+        record = self.components.direction_histogram(
+            facility_count=len(self.facilities),
+        )
+        self.preferred_direction = tuple(
+            directions.labels[direction] for direction in record.argmax(axis=1)
+        )
 
     def update(
         self,
-        named_maps: dict[str, list[list[int]]],
         attack_directions: dict[str, tuple[int, int]],
-        facilities: Iterable[Facility],
-        directions: dict[str, set],
+        directions: Directions,
         style: int,
+        synchronous: bool = False,
+        pool: Optional[StripePool] = None,
+        incremental: bool = False,
     ):
-        self.clear_connected_cell_data()
-        self.set_connected_cell_data(named_maps)
-        self.get_preferred_direction(
-            facilities=facilities,
-            directions=directions,
+        self.profiler.start()
+        if incremental:
+            average_score = self.update_incremental(
+                attack_directions=attack_directions,
+                directions=directions,
+                style=style,
+            )
+        else:
+            average_score = self.update_full(
+                attack_directions=attack_directions,
+                directions=directions,
+                style=style,
+                synchronous=synchronous,
+                pool=pool,
+            )
+        self.profiler.count('flips', len(self.changed[0]))
+        self.profiler.finish(style=style, score=average_score)
+        return average_score
+
+    def update_full(
+        self,
+        attack_directions: dict[str, tuple[int, int]],
+        directions: Directions,
+        style: int,
+        synchronous: bool = False,
+        pool: Optional[StripePool] = None,
+    ):
+        with self.profiler.phase('components'):
+            self.set_connected_cell_data(directions)
+        self.profiler.count('components', (self.components.area > 0).sum())
+        with self.profiler.phase('directions'):
+            self.get_preferred_direction(directions)
+        self.cell_scores = None
+        attack_offsets = tuple(attack_directions[direction] for direction in self.preferred_direction)
+        occupied = self.owners != EMPTY
+
+        if pool is not None:
+            # The workers score their own stripes before propagating them.
+            with self.profiler.phase('propagation'):
+                owners, average_score = pool.step(
+                    owners=self.owners,
+                    labels=self.components.labels,
+                    area=self.region_area,
+                    average_topography=self.components.average_topography,
+                    attack_offsets=attack_offsets,
+                    style=style,
+                )
+            self.profiler.count('cells_rescored', occupied.sum())
+            self.profiler.count('cells_evaluated', occupied.sum())
+            self.changed = np.nonzero(owners != self.owners)
+            self.owners = owners
+            return average_score
+
+        with self.profiler.phase('scoring'):
+            scores = score_raster(
+                table=self.table,
+                layers=self.layers,
+                area=self.region_area[self.components.labels],
+                average_topography=self.components.average_topography[self.components.labels],
+                dtype=self.dtype,
+            )
+            average_score = float(cell_scores(self.owners, scores)[occupied].mean())
+        self.profiler.count('cells_rescored', occupied.sum())
+
+        with self.profiler.phase('propagation'):
+            if synchronous:
+                owners = propagate(
+                    owners=self.owners,
+                    scores=scores,
+                    attack_offsets=attack_offsets,
+                    style=style,
+                )
+            else:
+                current = self.owners.tolist()
+                sweep(
+                    owners=current,
+                    scores=scores.tolist(),
+                    attack_offsets=attack_offsets,
+                    style=style,
+                    rows=range(len(current)),
+                    out=current,
+                )
+                owners = np.array(current, dtype=self.owners.dtype)
+        self.profiler.count('cells_evaluated', occupied.sum())
+        self.changed = np.nonzero(owners != self.owners)
+        self.owners = owners
+        return average_score
+
+    def rescore(self, ys: np.ndarray, xs: np.ndarray):
+        labels = self.components.labels[ys, xs]
+        scores = score_cells(
+            table=self.table,
+            owners=self.owners[ys, xs],
+            layers=dict((name, layer[ys, xs]) for name, layer in self.layers.items()),
+            area=self.components.area[labels] * self.area_scale,
+            average_topography=self.components.average_topography[labels],
+            dtype=self.dtype,
         )
+        self.total_score += float((scores - self.cell_scores[ys, xs]).sum())
+        self.cell_scores[ys, xs] = scores
+        self.profiler.count('cells_rescored', ys.size)
+
+    def update_incremental(
+        self,
+        attack_directions: dict[str, tuple[int, int]],
+        directions: Directions,
+        style: int,
+    ):
+        '''
+        Synchronous update that only rescores the regions touched by the
+        previous step and only re-evaluates the cells whose neighbourhood
+        changed. Gives the same result as update(synchronous=True).
+        '''
+        with self.profiler.phase('components'):
+            added = self.set_connected_cell_data(directions)
+        self.profiler.count('components', (self.components.area > 0).sum())
+        previous_direction = getattr(self, 'preferred_direction', None)
+        with self.profiler.phase('directions'):
+            self.get_preferred_direction(directions)
+        occupied = self.owners != EMPTY
 
-        total_score = _0
-        region_count = _0
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if self.values[y][x]:
-                    region_count += _1
-                    total_score += self.values[y][x].facility.score(
-                        named_maps=named_maps,
-                        x=x,
-                        y=y,
-                        connected_cells=self.values[y][x].connected_cells,
-                    )
-        print(total_score / region_count)
+        with self.profiler.phase('scoring'):
+            if self.cell_scores is None or added is None:
+                # A cell left alone by one style may still flip under another,
+                # so every style keeps its own record of cells to re-evaluate.
+                self.cell_scores = np.zeros(self.owners.shape, dtype=self.dtype)
+                self.total_score = 0.0
+                self.dirty = np.repeat(frontier(self.owners)[None], len(PROPAGATION_STYLE_CHOICES), axis=0)
+                ys, xs = np.nonzero(occupied)
+                self.rescore(ys, xs)
+            else:
+                ys, xs = self.components.cells(added)
+                self.rescore(ys, xs)
+                self.profiler.count('score_cache_hits', occupied.sum() - ys.size)
+                height, width = self.owners.shape
+                touched = np.zeros(self.owners.shape, dtype=bool)
+                for dx, dy in POSITIONS:
+                    touched[np.clip(ys + dy, 0, height - 1), np.clip(xs + dx, 0, width - 1)] = True
+                for facility, direction in enumerate(self.preferred_direction):
+                    if direction != previous_direction[facility]:
+                        touched |= dilate(self.owners == facility)
+                self.dirty |= touched
+            average_score = self.total_score / max(1, occupied.sum())
 
-        for y in range(len(self.values)):
-            for x in range(len(self.values[y])):
-                if self.values[y][x]:
-                    surrounded_by_tally = defaultdict(Decimal)
-                    surrounded_by_scores = defaultdict(Decimal)
-                    can_attack = set()
-                    for nx, ny in neighbors(x=x, y=y, grid=self.values):
-                        if all([
-                            self.values[ny][nx].facility != self.values[y][x].facility,
-                            (nx - x, ny - y) == attack_directions[self.values[ny][nx].preferred_direction]
-                        ]):
-                            can_attack.add(self.values[ny][nx].facility)
-                        surrounded_by_tally[self.values[ny][nx].facility] += 1
-                        surrounded_by_scores[self.values[ny][nx].facility] += self.values[ny][nx].facility.score(
-                            named_maps=named_maps,
-                            x=nx,
-                            y=ny,
-                            connected_cells=self.values[ny][nx].connected_cells,
-                        )
-                    for facility, tally in surrounded_by_tally.items():
-                        surrounded_by_scores[facility] /= tally
-                    
-                    new_value = None
-                    can_rank_by_score = surrounded_by_scores and self.values[y][x].facility == min(
-                        surrounded_by_scores,
-                        key=lambda facility: surrounded_by_scores[facility]
-                    )
-                    can_rank_by_tally = surrounded_by_tally and self.values[y][x].facility == min(
-                        surrounded_by_tally,
-                        key=lambda facility: surrounded_by_tally[facility]
-                    )
-                    match style:
-                        case 0:
-                            if can_rank_by_score:
-                                new_value = sorted(
-                                    surrounded_by_scores,
-                                    key=lambda facility: surrounded_by_scores[facility]
-                                )[-1]
-                        case 1:
-                            if can_rank_by_score:
-                                new_value = sorted(
-                                    can_attack.union((None,)),
-                                    key=lambda facility: surrounded_by_scores[facility]
-                                )[-1]
-                        case 2:
-                            if can_rank_by_tally:
-                                new_value = sorted(
-                                    surrounded_by_tally,
-                                    key=lambda facility: surrounded_by_tally[facility]
-                                )[-1]
-                        case 3:
-                            if can_rank_by_tally:
-                                new_value = sorted(
-                                    can_attack.union((None,)),
-                                    key=lambda facility: surrounded_by_tally[facility]
-                                )[-1]
-                    if new_value:
-                        self.values[y][x].facility = new_value
-                        self.values[y][x].color = new_value.color
+        with self.profiler.phase('propagation'):
+            ys, xs = np.nonzero(self.dirty[style] & occupied)
+            self.dirty[style] = False
+            owners = propagate_at(
+                owners=self.owners,
+                scores=self.cell_scores,
+                facility_count=len(self.facilities),
+                attack_offsets=tuple(attack_directions[direction] for direction in self.preferred_direction),
+                style=style,
+                ys=ys,
+                xs=xs,
+            )
+            flipped = owners != self.owners[ys, xs]
+            self.changed = (ys[flipped], xs[flipped])
+            self.owners[self.changed] = owners[flipped]
+        self.profiler.count('cells_evaluated', ys.size)
+        return average_score
@@ -0,0 +1,151 @@
+from math import exp
+
+import numpy as np
+
+from . import Grid
+from .components import (
+    EMPTY,
+    ComponentTable,
+)
+from .scoring import score_cells
+
+# 4-neighbours a cell can take its new owner from, as (dy, dx).
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+class Annealer:
+    '''
+    Local search over single-cell flips of a grid. A move gives a cell on
+    a region boundary the owner of one of its 4-neighbours and is scored
+    by its exact change in total score: only the regions the flip splits
+    or merges are relabelled and rescored, with their new areas and
+    average topographies. Improving moves are always taken, worse ones
+    with probability exp(delta / temperature); a temperature of 0 is plain
+    hill climbing.
+
+    `temperature` is in units of the average cell score of the starting
+    grid and is multiplied by `cooling` after every move. The owners of
+    `grid` are changed in place; `anneal` resets its derived state.
+    '''
+    def __init__(
+        self,
+        grid: Grid,
+        temperature: float = 0.0,
+        cooling: float = 1.0,
+    ):
+        self.grid = grid
+        self.rng = grid.rng
+        self.components = ComponentTable(owners=grid.owners, topography=grid.layers['topography'])
+        self.occupied = np.nonzero(grid.owners != EMPTY)
+        labels = self.components.labels[self.occupied]
+        self.cell_scores = np.zeros(grid.owners.shape, dtype=grid.dtype)
+        self.cell_scores[self.occupied] = score_cells(
+            table=grid.table,
+            owners=grid.owners[self.occupied],
+            layers=dict((name, layer[self.occupied]) for name, layer in grid.layers.items()),
+            area=self.components.area[labels] * grid.area_scale,
+            average_topography=self.components.average_topography[labels],
+            dtype=grid.dtype,
+        )
+        self.total_score = float(self.cell_scores[self.occupied].sum(dtype=np.float64))
+        self.temperature = temperature * abs(self.average_score)
+        self.cooling = cooling
+        self.cells_rescored = self.occupied[0].size
+
+    @property
+    def average_score(self):
+        return self.total_score / max(1, self.occupied[0].size)
+
+    def propose(self, attempts: int = 64):
+        '''
+        A random cell and the differing owner of a random 4-neighbour of
+        it. Draws up to `attempts` times, then picks among all such pairs;
+        None if there are none left.
+        '''
+        owners = self.grid.owners
+        height, width = owners.shape
+        ys, xs = self.occupied
+        for _ in range(attempts):
+            cell = self.rng.integers(ys.size)
+            dy, dx = NEIGHBOURS[self.rng.integers(len(NEIGHBOURS))]
+            y, x = int(ys[cell]), int(xs[cell])
+            v, u = y + dy, x + dx
+            if 0 <= v < height and 0 <= u < width and owners[v, u] not in (EMPTY, owners[y, x]):
+                return y, x, int(owners[v, u])
+
+        candidates = []
+        for dy, dx in NEIGHBOURS:
+            v, u = ys + dy, xs + dx
+            inside = (0 <= v) & (v < height) & (0 <= u) & (u < width)
+            y, x, v, u = ys[inside], xs[inside], v[inside], u[inside]
+            differ = (owners[v, u] != EMPTY) & (owners[v, u] != owners[y, x])
+            candidates.append(np.stack((y[differ], x[differ], owners[v[differ], u[differ]])))
+        candidates = np.concatenate(candidates, axis=1)
+        if not candidates.shape[1]:
+            return None
+        y, x, owner = candidates[:, self.rng.integers(candidates.shape[1])]
+        return int(y), int(x), int(owner)
+
+    def evaluate(self, y: int, x: int, owner: int):
+        '''
+        Exact change in total score if the cell at (y, x) were given to
+        `owner`, with the relabelling and the new scores that make it.
+        '''
+        owners = self.grid.owners
+        previous = owners[y, x]
+        owners[y, x] = owner
+        try:
+            relabelling = self.components.relabel(owners, [y], [x])
+        finally:
+            owners[y, x] = previous
+        ys, xs, labels = relabelling.ys, relabelling.xs, relabelling.labels
+        scores = score_cells(
+            table=self.grid.table,
+            owners=relabelling.owners,
+            layers=dict((name, layer[ys, xs]) for name, layer in self.grid.layers.items()),
+            area=relabelling.area[labels] * self.grid.area_scale,
+            average_topography=relabelling.topography_sum[labels] / relabelling.area[labels],
+            dtype=self.grid.dtype,
+        )
+        self.cells_rescored += scores.size
+        delta = float(scores.sum(dtype=np.float64) - self.cell_scores[ys, xs].sum(dtype=np.float64))
+        return delta, relabelling, scores
+
+    def step(self):
+        '''
+        Proposes one move and takes it or not; returns whether it was taken
+        and its change in total score.
+        '''
+        move = self.propose()
+        if move is None:
+            return False, 0.0
+        y, x, owner = move
+        delta, relabelling, scores = self.evaluate(y, x, owner)
+        accepted = delta > 0 or (
+            self.temperature > 0 and self.rng.random() < exp(max(delta / self.temperature, -700))
+        )
+        if accepted:
+            self.grid.owners[y, x] = owner
+            self.components.commit(relabelling)
+            self.cell_scores[relabelling.ys, relabelling.xs] = scores
+            self.total_score += delta
+        self.temperature *= self.cooling
+        return accepted, delta
+
+    def anneal(self, moves: int):
+        '''
+        Runs `moves` moves as one profiler step and returns the average
+        cell score after them.
+        '''
+        profiler = self.grid.profiler
+        profiler.start()
+        rescored = self.cells_rescored
+        accepted = 0
+        with profiler.phase('annealing'):
+            for _ in range(moves):
+                accepted += self.step()[0]
+        profiler.count('moves', moves)
+        profiler.count('accepted', accepted)
+        profiler.count('cells_rescored', self.cells_rescored - rescored)
+        self.grid.load_owners(self.grid.owners)
+        profiler.finish(score=self.average_score, temperature=self.temperature)
+        return self.average_score
@@ -0,0 +1,381 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+EMPTY = -1
+
+# Facility ids per cell; EMPTY must fit.
+OWNER_DTYPE = np.int8
+
+def _find_roots(size: int, u: np.ndarray, v: np.ndarray):
+    # Union-find over the (u, v) edge list, run as rounds of vectorized
+    # hooking and pointer jumping. Every root is hooked under a smaller
+    # index, so each tree ends up rooted at its smallest cell.
+    parent = np.arange(size)
+    while u.size:
+        root_u = parent[u]
+        root_v = parent[v]
+        differ = root_u != root_v
+        u, v = u[differ], v[differ]
+        if not u.size:
+            break
+        root_u, root_v = root_u[differ], root_v[differ]
+        parent[np.maximum(root_u, root_v)] = np.minimum(root_u, root_v)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+def _number_roots(roots: np.ndarray, members: np.ndarray):
+    # Numbers the trees of `_find_roots` among `members` from 1 in order
+    # of their roots, i.e. of their first cells; returns the number of
+    # every index, meaningful at the roots, and the count including 0.
+    is_root = (roots == np.arange(roots.size)) & members
+    numbers = np.cumsum(is_root)
+    return numbers, int(numbers[-1]) + 1 if numbers.size else 1
+
+def label_components(
+    owners: np.ndarray,
+    topography: Optional[np.ndarray] = None,
+):
+    '''
+    Labels the 4-connected regions of equal owner in `owners`, where
+    EMPTY marks cells outside of the map. Returns the label raster (0 for
+    empty cells, 1..n in row-major order of each region's first cell),
+    the area of every label and, if `topography` is given, its average.
+    '''
+    owners = np.asarray(owners)
+    occupied = owners != EMPTY
+    index = np.arange(owners.size).reshape(owners.shape)
+
+    horizontal = occupied[:, :-1] & (owners[:, :-1] == owners[:, 1:])
+    vertical = occupied[:-1, :] & (owners[:-1, :] == owners[1:, :])
+    roots = _find_roots(
+        size=owners.size,
+        u=np.concatenate((index[:, :-1][horizontal], index[:-1, :][vertical])),
+        v=np.concatenate((index[:, 1:][horizontal], index[1:, :][vertical])),
+    )
+
+    labels = np.zeros(owners.shape, dtype=np.int32)
+    numbers, count = _number_roots(roots, occupied.ravel())
+    labels[occupied] = numbers[roots[occupied.ravel()]]
+
+    area = np.bincount(labels.ravel(), minlength=count)
+    area[0] = 0
+    if topography is None:
+        return labels, area, None
+    average_topography = np.bincount(
+        labels.ravel(),
+        weights=np.asarray(topography, dtype=np.float64).ravel(),
+        minlength=area.size,
+    ) / np.maximum(area, 1)
+    average_topography[0] = 0
+    return labels, area, average_topography
+
+def _statistics(
+    labels: np.ndarray,
+    ys: np.ndarray,
+    xs: np.ndarray,
+    count: int,
+    topography: np.ndarray,
+    directions: Optional[np.ndarray],
+    direction_count: int,
+):
+    # Statistics of `count` labels from the label, position, topography
+    # and direction of every labelled cell, given in row-major order.
+    area = np.bincount(labels, minlength=count)
+    topography_sum = np.bincount(labels, weights=topography, minlength=count)
+    if directions is None:
+        histogram = np.zeros((count, direction_count), dtype=np.int64)
+    else:
+        histogram = np.bincount(
+            labels.astype(np.int64) * direction_count + directions,
+            minlength=count * direction_count,
+        ).reshape(count, direction_count)
+    area[0] = 0
+    topography_sum[0] = 0
+    histogram[0] = 0
+
+    bounds = np.zeros((count, 4), dtype=np.int64)
+    if ys.size:
+        order = np.argsort(labels, kind='stable')
+        member, ys, xs = labels[order], ys[order], xs[order]
+        starts = np.flatnonzero(np.r_[True, member[1:] != member[:-1]])
+        present = member[starts]
+        bounds[present, 0] = ys[starts]
+        bounds[present, 1] = np.minimum.reduceat(xs, starts)
+        bounds[present, 2] = np.maximum.reduceat(ys, starts) + 1
+        bounds[present, 3] = np.maximum.reduceat(xs, starts) + 1
+    return area, topography_sum, histogram, bounds
+
+def _label_cells(owners: np.ndarray, flat: np.ndarray):
+    '''
+    label_components over only the cells at the sorted flat indices
+    `flat` of `owners`, all occupied: returns the label of every one of
+    them, numbered in row-major order of each region's first cell, and
+    the number of labels including 0.
+    '''
+    if not flat.size:
+        return np.zeros(0, dtype=np.int64), 1
+    height, width = owners.shape
+    cell_owners = owners.ravel()[flat]
+    # Position of every grid cell among `flat`, -1 for the others, with a
+    # row of padding so the neighbours below the last row stay in range.
+    position = np.full(owners.size + width, -1, dtype=np.int64)
+    position[flat] = np.arange(flat.size)
+    u = []
+    v = []
+    for step, inside in ((1, flat % width != width - 1), (width, flat < (height - 1) * width)):
+        neighbour = position[flat + step]
+        linked = inside & (neighbour >= 0)
+        linked[linked] = cell_owners[neighbour[linked]] == cell_owners[linked]
+        u.append(np.flatnonzero(linked))
+        v.append(neighbour[linked])
+    roots = _find_roots(size=flat.size, u=np.concatenate(u), v=np.concatenate(v))
+    numbers, count = _number_roots(roots, np.ones(flat.size, dtype=bool))
+    return numbers[roots], count
+
+class Relabelling(NamedTuple):
+    '''
+    Regions around a set of changed cells, labelled anew: the cells at
+    (ys, xs), in row-major order, with their `owners` and new `labels`,
+    and `area` to `bounds` the statistics of every new label.
+    '''
+    released: np.ndarray
+    ys: np.ndarray
+    xs: np.ndarray
+    owners: np.ndarray
+    labels: np.ndarray
+    area: np.ndarray
+    topography_sum: np.ndarray
+    histogram: np.ndarray
+    bounds: np.ndarray
+
+class ComponentTable:
+    '''
+    Per-label statistics of the connected regions of a grid: owner, area,
+    topography sum, direction histogram and bounding box. Label 0 is
+    reserved for empty cells; freed labels are recycled.
+    '''
+    labels: np.ndarray
+    owner: np.ndarray
+    area: np.ndarray
+    topography_sum: np.ndarray
+    histogram: np.ndarray
+    bounds: np.ndarray
+
+    def __init__(
+        self,
+        owners: np.ndarray,
+        topography: np.ndarray,
+        directions: Optional[np.ndarray] = None,
+        direction_count: int = 0,
+    ):
+        self.topography = np.asarray(topography, dtype=np.float64)
+        self.directions = directions
+        self.direction_count = direction_count
+        self._build(owners)
+
+    def _build(self, owners: np.ndarray):
+        self.labels, area, _ = label_components(owners)
+        ys, xs = np.nonzero(self.labels)
+        self.area, self.topography_sum, self.histogram, self.bounds = _statistics(
+            labels=self.labels[ys, xs],
+            ys=ys,
+            xs=xs,
+            count=area.size,
+            topography=self.topography[ys, xs],
+            directions=None if self.directions is None else self.directions[ys, xs],
+            direction_count=self.direction_count,
+        )
+        self.owner = np.full(area.size, EMPTY, dtype=OWNER_DTYPE)
+        self.owner[self.labels.ravel()] = np.asarray(owners).ravel()
+        self.owner[0] = EMPTY
+        self.free = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return self.area.size
+
+    @property
+    def average_topography(self):
+        return self.topography_sum / np.maximum(self.area, 1)
+
+    def _allocate(self, count: int):
+        kept = max(0, self.free.size - count)
+        reused = self.free[kept:]
+        self.free = self.free[:kept]
+        missing = count - reused.size
+        if not missing:
+            return reused
+        start = self.area.size
+        capacity = max(start + missing, 2 * start)
+        grow = capacity - start
+        self.owner = np.concatenate((self.owner, np.full(grow, EMPTY, dtype=OWNER_DTYPE)))
+        self.area = np.concatenate((self.area, np.zeros(grow, dtype=self.area.dtype)))
+        self.topography_sum = np.concatenate((self.topography_sum, np.zeros(grow)))
+        self.histogram = np.concatenate(
+            (self.histogram, np.zeros((grow, self.direction_count), dtype=self.histogram.dtype))
+        )
+        self.bounds = np.concatenate((self.bounds, np.zeros((grow, 4), dtype=np.int64)))
+        self.free = np.concatenate((self.free, np.arange(capacity - 1, start + missing - 1, -1)))
+        return np.concatenate((reused, np.arange(start, start + missing))).astype(np.int64)
+
+    def affected(
+        self,
+        owners: np.ndarray,
+        ys: np.ndarray,
+        xs: np.ndarray,
+    ):
+        '''
+        Labels whose regions may split or merge once the cells at (ys, xs)
+        take their owner in `owners`: the old labels of those cells and the
+        labels of 4-neighbours that now share their owner.
+        '''
+        height, width = owners.shape
+        affected = np.zeros(self.area.size, dtype=bool)
+        affected[self.labels[ys, xs]] = True
+        for dy, dx in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            v = ys + dy
+            u = xs + dx
+            inside = (0 <= v) & (v < height) & (0 <= u) & (u < width)
+            v, u = v[inside], u[inside]
+            same = owners[v, u] == owners[ys[inside], xs[inside]]
+            affected[self.labels[v[same], u[same]]] = True
+        affected[0] = False
+        return np.flatnonzero(affected)
+
+    def relabel(
+        self,
+        owners: np.ndarray,
+        ys: np.ndarray,
+        xs: np.ndarray,
+    ):
+        '''
+        Labels the regions touching the cells at (ys, xs) as they are in
+        `owners`, without changing the table, so a change can be tried
+        before it is made. `commit` applies the result.
+
+        Only the cells of those regions are gathered and labelled, so the
+        work follows the size of the regions changed rather than of the
+        area they span.
+        '''
+        ys = np.asarray(ys, dtype=np.int64)
+        xs = np.asarray(xs, dtype=np.int64)
+        return self._relabel(owners, ys, xs, self.affected(owners, ys, xs))
+
+    def _relabel(
+        self,
+        owners: np.ndarray,
+        ys: np.ndarray,
+        xs: np.ndarray,
+        released: np.ndarray,
+    ):
+        width = owners.shape[1]
+        region_ys, region_xs = self.cells(released)
+        flat = region_ys * width + region_xs
+        # Changed cells that were empty belong to no released region.
+        if not self.labels[ys, xs].all():
+            flat = np.union1d(flat, ys * width + xs)
+        labels, count = _label_cells(owners, flat)
+        ys, xs = np.divmod(flat, width)
+        area, topography_sum, histogram, bounds = _statistics(
+            labels=labels,
+            ys=ys,
+            xs=xs,
+            count=count,
+            topography=self.topography[ys, xs],
+            directions=None if self.directions is None else self.directions[ys, xs],
+            direction_count=self.direction_count,
+        )
+        return Relabelling(
+            released=released,
+            ys=ys,
+            xs=xs,
+            owners=owners[ys, xs],
+            labels=labels,
+            area=area,
+            topography_sum=topography_sum,
+            histogram=histogram,
+            bounds=bounds,
+        )
+
+    def commit(self, relabelling: Relabelling):
+        released = relabelling.released
+        self.free = np.concatenate((self.free, released))
+        self.owner[released] = EMPTY
+        self.area[released] = 0
+        self.topography_sum[released] = 0
+        self.histogram[released] = 0
+        self.bounds[released] = 0
+
+        added = self._allocate(relabelling.area.size - 1)
+        mapping = np.concatenate(([0], added))
+        self.labels[relabelling.ys, relabelling.xs] = mapping[relabelling.labels]
+        new_owner = np.full(relabelling.area.size, EMPTY, dtype=OWNER_DTYPE)
+        new_owner[relabelling.labels] = relabelling.owners
+        self.owner[added] = new_owner[1:]
+        self.area[added] = relabelling.area[1:]
+        self.topography_sum[added] = relabelling.topography_sum[1:]
+        self.histogram[added] = relabelling.histogram[1:]
+        self.bounds[added] = relabelling.bounds[1:]
+        return released, added
+
+    def reassign(
+        self,
+        owners: np.ndarray,
+        ys: np.ndarray,
+        xs: np.ndarray,
+    ):
+        '''
+        Updates the table after the cells at (ys, xs) changed owner, with
+        `owners` already holding their new values. Only the regions touching
+        those cells are relabelled, unless they hold most of the grid, when
+        the table is rebuilt. Returns the released and the new labels.
+        '''
+        if not np.size(ys):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        xs = np.asarray(xs, dtype=np.int64)
+        released = self.affected(owners, ys, xs)
+        # Relabelling cell by cell costs more per cell than labelling the
+        # raster, and stops paying off at about two thirds of the grid.
+        if 3 * (self.area[released].sum() + ys.size) > 2 * self.area.sum():
+            released = np.flatnonzero(self.area)
+            self._build(owners)
+            return released, np.flatnonzero(self.area)
+        return self.commit(self._relabel(owners, ys, xs, released))
+
+    def direction_histogram(self, facility_count: int):
+        live = self.owner != EMPTY
+        return np.bincount(
+            (self.owner[live, None].astype(np.int64) * self.direction_count + np.arange(self.direction_count)).ravel(),
+            weights=self.histogram[live].ravel(),
+            minlength=facility_count * self.direction_count,
+        ).reshape(facility_count, self.direction_count)
+
+    def cells(self, labels: np.ndarray):
+        '''
+        The cells of the regions `labels`, in row-major order. Each region
+        is read from its own bounding box, unless those add up to more
+        than a small part of the grid, when one pass over it is cheaper.
+        '''
+        labels = np.asarray(labels, dtype=np.int64)
+        labels = labels[self.area[labels] > 0]
+        if not labels.size:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        top, left, bottom, right = self.bounds[labels].T
+        heights, widths = bottom - top, right - left
+        sizes = heights * widths
+        if 8 * sizes.sum() > self.labels.size:
+            member = np.zeros(self.area.size, dtype=bool)
+            member[labels] = True
+            return np.nonzero(member[self.labels])
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        widths = np.repeat(widths, sizes)
+        ys = np.repeat(top, sizes) + offsets // widths
+        xs = np.repeat(left, sizes) + offsets % widths
+        inside = self.labels[ys, xs] == np.repeat(labels, sizes)
+        flat = np.sort(ys[inside] * self.labels.shape[1] + xs[inside])
+        return np.divmod(flat, self.labels.shape[1])
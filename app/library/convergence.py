@@ -0,0 +1,34 @@
+from typing import Optional
+
+class Convergence:
+    '''
+    Tracks flips and average scores step by step and reports convergence
+    once `patience` consecutive steps flip at most `flips` cells or move
+    the average score by at most `score`.
+    '''
+    def __init__(
+        self,
+        flips: int = 0,
+        score: Optional[float] = None,
+        patience: int = 1,
+    ):
+        self.flips = flips
+        self.score = score
+        self.patience = patience
+        self.previous_score = None
+        self.streak = 0
+
+    def update(self, flips: int, score: float):
+        score_settled = (
+            self.score is not None
+            and self.previous_score is not None
+            and abs(score - self.previous_score) <= self.score
+        )
+        settled = flips <= self.flips or score_settled
+        self.previous_score = score
+        self.streak = self.streak + 1 if settled else 0
+        return self.converged
+
+    @property
+    def converged(self):
+        return self.streak >= self.patience
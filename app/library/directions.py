@@ -0,0 +1,47 @@
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+class Directions(NamedTuple):
+    ids: np.ndarray
+    labels: tuple[str, ...]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[str]]):
+        labels: dict[str, int] = {}
+        ids = []
+        for y, row in enumerate(rows):
+            ids.append([])
+            for x, label in enumerate(row):
+                if not isinstance(label, str) or not label:
+                    raise ValueError(f'Direction at row {y + 1}, column {x + 1} is blank')
+                ids[-1].append(labels.setdefault(label, len(labels)))
+        if len(set(map(len, ids))) > 1:
+            raise ValueError('Direction rows differ in length')
+        return cls(ids=np.array(ids, dtype=np.uint8), labels=tuple(labels))
+
+    def sample(
+        self,
+        shape: tuple[int, int],
+        resolution: int,
+        source_resolution: int,
+    ):
+        '''
+        The directions of a grid of `shape` cells taken every `resolution`
+        pixels, from these given every `source_resolution` pixels: every
+        cell gets the direction of the source cell holding its pixel.
+        '''
+        if resolution < source_resolution:
+            raise ValueError(
+                f'Directions are given every {source_resolution} pixels; '
+                f'a resolution of {resolution} is finer than that'
+            )
+        rows = np.arange(shape[0]) * resolution // source_resolution
+        columns = np.arange(shape[1]) * resolution // source_resolution
+        if (rows >= self.ids.shape[0]).any() or (columns >= self.ids.shape[1]).any():
+            raise ValueError(
+                f'Directions of shape {self.ids.shape} do not cover '
+                f'{shape} cells at a resolution of {resolution}'
+            )
+        return Directions(ids=self.ids[np.ix_(rows, columns)], labels=self.labels)
+
@@ -0,0 +1,33 @@
+import numpy as np
+
+from .components import EMPTY
+
+def upsample(
+    owners: np.ndarray,
+    factor: int,
+    shape: tuple[int, int],
+):
+    '''
+    Owners of a grid sampled every `factor` cells of a finer grid of
+    `shape`, repeated over the finer cells each coarse cell covers.
+    '''
+    ys = np.arange(shape[0]) // factor
+    xs = np.arange(shape[1]) // factor
+    return owners[ys[:, None], xs[None, :]]
+
+def seed(
+    coarse_owners: np.ndarray,
+    factor: int,
+    initial_owners: np.ndarray,
+):
+    '''
+    Initial owners of a finer grid taken from a solved coarser one. Cells
+    of the finer map that the coarse grid left empty keep their
+    `initial_owners`.
+    '''
+    upsampled = upsample(coarse_owners, factor, initial_owners.shape)
+    return np.where(
+        (initial_owners != EMPTY) & (upsampled != EMPTY),
+        upsampled,
+        initial_owners,
+    ).astype(initial_owners.dtype)
@@ -0,0 +1,244 @@
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Optional
+
+import numpy as np
+
+from .components import (
+    EMPTY,
+    OWNER_DTYPE,
+)
+from .propagation import (
+    cell_scores,
+    propagate,
+)
+from .scoring import (
+    FacilityTable,
+    score_raster,
+)
+
+_attached: dict[str, tuple[SharedMemory, np.ndarray]] = {}
+
+def attach(
+    name: str,
+    shape: tuple[int, ...],
+    dtype: np.dtype,
+):
+    if name not in _attached:
+        memory = SharedMemory(name=name)
+        _attached[name] = (memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf))
+    return _attached[name][1]
+
+class SharedArray:
+    memory: SharedMemory
+    array: np.ndarray
+
+    def __init__(
+        self,
+        shape: tuple[int, ...],
+        dtype: np.dtype,
+    ):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.memory = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * self.dtype.itemsize))
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    @property
+    def spec(self):
+        return self.memory.name, self.shape, self.dtype.str
+
+    def close(self):
+        del self.array
+        self.memory.close()
+        self.memory.unlink()
+
+class SharedStore:
+    '''
+    Arrays published once into named shared memory. `spec` is a small
+    picklable description that other processes pass to `attach_store` to
+    map the same memory without copying it.
+    '''
+    def __init__(
+        self,
+        arrays: dict[str, np.ndarray],
+        metadata: Optional[dict[str, Any]] = None,
+    ):
+        self.shared: dict[str, SharedArray] = {}
+        for name, array in arrays.items():
+            self.shared[name] = SharedArray(np.shape(array), np.asarray(array).dtype)
+            self.shared[name].array[...] = array
+        self.metadata = {} if metadata is None else metadata
+
+    @property
+    def spec(self):
+        return dict((name, shared.spec) for name, shared in self.shared.items()), self.metadata
+
+    def close(self):
+        for shared in self.shared.values():
+            shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+def attach_store(spec: tuple[dict[str, tuple], dict[str, Any]]):
+    specs, metadata = spec
+    arrays = {}
+    for name, array_spec in specs.items():
+        arrays[name] = attach(*array_spec).view()
+        arrays[name].setflags(write=False)
+    return arrays, metadata
+
+_stripe_state = {}
+
+def _attach_stripes(
+    layers_spec: tuple,
+    table: FacilityTable,
+    dtype: str,
+):
+    # Pool initializer: workers map the layers once and keep the table.
+    layers, _ = attach_store(layers_spec)
+    _stripe_state.update(layers=layers, table=table, dtype=np.dtype(dtype))
+
+def _step_stripe(
+    owners_spec: tuple,
+    labels_spec: tuple,
+    area_spec: tuple,
+    topography_spec: tuple,
+    out_spec: tuple,
+    attack_offsets: tuple[tuple[int, int], ...],
+    style: int,
+    start: int,
+    stop: int,
+):
+    owners = attach(*owners_spec)
+    labels = attach(*labels_spec)
+    area = attach(*area_spec)
+    average_topography = attach(*topography_spec)
+    out = attach(*out_spec)
+    top = max(0, start - 1)
+    bottom = min(owners.shape[0], stop + 1)
+    stripe_labels = labels[top:bottom]
+    scores = score_raster(
+        table=_stripe_state['table'],
+        layers=dict((name, layer[top:bottom]) for name, layer in _stripe_state['layers'].items()),
+        area=area[stripe_labels],
+        average_topography=average_topography[stripe_labels],
+        dtype=_stripe_state['dtype'],
+    )
+    stripe_owners = owners[top:bottom]
+    result = propagate(
+        owners=stripe_owners,
+        scores=scores,
+        attack_offsets=attack_offsets,
+        style=style,
+    )
+    inner = slice(start - top, stop - top)
+    out[start:stop] = result[inner]
+    occupied = stripe_owners[inner] != EMPTY
+    return float(cell_scores(stripe_owners, scores)[inner][occupied].sum(dtype=np.float64)), int(occupied.sum())
+
+class StripePool:
+    '''
+    Synchronous steps split into row stripes over a process pool. The map
+    layers are published once; every step shares the owners, the component
+    labels and the area and average topography of every component, and
+    each worker scores and propagates its own stripe, reading one halo row
+    above and below. The next generation comes back in shared memory.
+    '''
+    def __init__(
+        self,
+        layers: dict[str, np.ndarray],
+        table: FacilityTable,
+        processes: int,
+        stripes: Optional[int] = None,
+        dtype: np.dtype = np.float64,
+    ):
+        shape = next(iter(layers.values())).shape
+        self.layers = SharedStore(dict(
+            (name, np.asarray(layer, dtype=dtype)) for name, layer in layers.items()
+        ))
+        self.owners = SharedArray(shape, OWNER_DTYPE)
+        self.out = SharedArray(shape, OWNER_DTYPE)
+        self.labels = SharedArray(shape, np.int32)
+        self.area = SharedArray((0,), np.float64)
+        self.average_topography = SharedArray((0,), np.float64)
+        bounds = np.linspace(0, shape[0], (stripes or processes) + 1).astype(int)
+        self.stripes = tuple(
+            (int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        )
+        self.pool = Pool(
+            processes,
+            initializer=_attach_stripes,
+            initargs=(self.layers.spec, table, np.dtype(dtype).str),
+        )
+
+    def share_components(
+        self,
+        area: np.ndarray,
+        average_topography: np.ndarray,
+    ):
+        # The component table grows over a run; its buffers are
+        # reallocated at twice the size when it outgrows them.
+        if area.size > self.area.shape[0]:
+            for shared in (self.area, self.average_topography):
+                shared.close()
+            capacity = max(area.size, 2 * self.area.shape[0])
+            self.area = SharedArray((capacity,), np.float64)
+            self.average_topography = SharedArray((capacity,), np.float64)
+        self.area.array[:area.size] = area
+        self.average_topography.array[:area.size] = average_topography
+
+    def step(
+        self,
+        owners: np.ndarray,
+        labels: np.ndarray,
+        area: np.ndarray,
+        average_topography: np.ndarray,
+        attack_offsets: tuple[tuple[int, int], ...],
+        style: int,
+    ):
+        '''
+        The next generation of `owners` and the average cell score they
+        had, with the regions described by `labels` and the per-label
+        `area` and `average_topography`.
+        '''
+        self.owners.array[...] = owners
+        self.out.array[...] = owners
+        self.labels.array[...] = labels
+        self.share_components(area, average_topography)
+        totals = self.pool.starmap(
+            _step_stripe,
+            [
+                (
+                    self.owners.spec,
+                    self.labels.spec,
+                    self.area.spec,
+                    self.average_topography.spec,
+                    self.out.spec,
+                    attack_offsets,
+                    style,
+                    start,
+                    stop,
+                )
+                for start, stop in self.stripes
+            ],
+        )
+        total = sum(total for total, _ in totals)
+        count = sum(count for _, count in totals)
+        return self.out.array.copy(), total / max(1, count)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for shared in (self.owners, self.out, self.labels, self.area, self.average_topography):
+            shared.close()
+        self.layers.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from json import dumps
+from time import perf_counter
+from typing import Any, Callable, IO, Iterable
+
+Hook = Callable[[dict[str, Any]], None]
+
+class Profiler:
+    '''
+    Phase timers and counters of one step at a time. `start` opens a step,
+    `phase` times a block, `count` adds to a counter and `finish` closes
+    the step, passing its record to every hook.
+    '''
+    def __init__(self, hooks: Iterable[Hook] = ()):
+        self.hooks = list(hooks)
+        self.step = 0
+        self.last = None
+        self.start()
+
+    def start(self):
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.started = perf_counter()
+
+    def add_hook(self, hook: Hook):
+        self.hooks.append(hook)
+        return hook
+
+    @contextmanager
+    def phase(self, name: str):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - started
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def finish(self, **fields):
+        record = dict(
+            step=self.step,
+            **fields,
+            seconds=perf_counter() - self.started,
+            phases=self.phases,
+            counters=self.counters,
+        )
+        self.step += 1
+        self.last = record
+        self.start()
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+class JsonLines:
+    '''
+    Profiler hook writing every record as one line of JSON.
+    '''
+    def __init__(self, file: IO[str]):
+        self.file = file
+
+    def __call__(self, record: dict[str, Any]):
+        self.file.write(dumps(record) + '\n')
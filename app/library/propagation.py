@@ -0,0 +1,297 @@
+from collections import defaultdict
+
+import numpy as np
+
+from .components import EMPTY
+
+# Neighbour offsets (dx, dy) in the order `neighbors` visits them.
+POSITIONS = tuple((dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+
+def valid(x: int, y: int, grid: list[list[int]]):
+    return all([
+        0 <= x < len(grid[0]),
+        0 <= y < len(grid),
+    ]) and grid[y][x] != EMPTY
+
+def neighbors(x: int, y: int, grid: list[list[int]]):
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if valid(x + dx, y + dy, grid):
+                yield (x + dx, y + dy)
+
+def sweep(
+    owners: list[list[int]],
+    scores: list[list[list[float]]],
+    attack_offsets: tuple[tuple[int, int], ...],
+    style: int,
+    rows: range,
+    out: list[list[int]],
+):
+    '''
+    Runs one propagation pass over `rows`, reading owners from `owners`
+    and writing new owners to `out`. Passing the same list for both gives
+    the in-place (scan-order dependent) sweep; a copy gives a synchronous
+    one.
+    '''
+    for y in rows:
+        for x in range(len(owners[y])):
+            if owners[y][x] != EMPTY:
+                surrounded_by_tally = defaultdict(int)
+                surrounded_by_scores = defaultdict(float)
+                can_attack = {}
+                for nx, ny in neighbors(x=x, y=y, grid=owners):
+                    if all([
+                        owners[ny][nx] != owners[y][x],
+                        (nx - x, ny - y) == attack_offsets[owners[ny][nx]]
+                    ]):
+                        can_attack[owners[ny][nx]] = None
+                    surrounded_by_tally[owners[ny][nx]] += 1
+                    surrounded_by_scores[owners[ny][nx]] += scores[owners[ny][nx]][ny][nx]
+                for facility, tally in surrounded_by_tally.items():
+                    surrounded_by_scores[facility] /= tally
+                
+                new_value = None
+                can_rank_by_score = surrounded_by_scores and owners[y][x] == min(
+                    surrounded_by_scores,
+                    key=lambda facility: surrounded_by_scores[facility]
+                )
+                can_rank_by_tally = surrounded_by_tally and owners[y][x] == min(
+                    surrounded_by_tally,
+                    key=lambda facility: surrounded_by_tally[facility]
+                )
+                match style:
+                    case 0:
+                        if can_rank_by_score:
+                            new_value = sorted(
+                                surrounded_by_scores,
+                                key=lambda facility: surrounded_by_scores[facility]
+                            )[-1]
+                    case 1:
+                        if can_rank_by_score:
+                            new_value = sorted(
+                                (None, *can_attack),
+                                key=lambda facility: surrounded_by_scores[facility]
+                            )[-1]
+                    case 2:
+                        if can_rank_by_tally:
+                            new_value = sorted(
+                                surrounded_by_tally,
+                                key=lambda facility: surrounded_by_tally[facility]
+                            )[-1]
+                    case 3:
+                        if can_rank_by_tally:
+                            new_value = sorted(
+                                (None, *can_attack),
+                                key=lambda facility: surrounded_by_tally[facility]
+                            )[-1]
+                if new_value is not None and new_value != owners[y][x]:
+                    out[y][x] = new_value
+
+def cell_scores(
+    owners: np.ndarray,
+    scores: np.ndarray,
+):
+    occupied = owners != EMPTY
+    return np.where(
+        occupied,
+        np.take_along_axis(scores, np.where(occupied, owners, 0)[None], axis=0)[0],
+        0,
+    )
+
+def dilate(mask: np.ndarray):
+    padded = np.pad(mask, 1)
+    height, width = mask.shape
+    dilated = np.zeros(mask.shape, dtype=bool)
+    for dx, dy in POSITIONS:
+        dilated |= padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+    return dilated
+
+def frontier(owners: np.ndarray):
+    '''
+    Cells with another facility among their neighbours. Every other cell
+    sees only its own facility, so no style can flip it.
+    '''
+    height, width = owners.shape
+    padded = np.pad(owners, 1, constant_values=EMPTY)
+    mixed = np.zeros(owners.shape, dtype=bool)
+    for dx, dy in POSITIONS:
+        neighbour = padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        mixed |= (neighbour != EMPTY) & (neighbour != owners)
+    return mixed & (owners != EMPTY)
+
+def aggregate(
+    owners: np.ndarray,
+    neighbour_owners: list[np.ndarray],
+    neighbour_scores: list[np.ndarray],
+    facility_count: int,
+    attack_positions: np.ndarray,
+):
+    '''
+    Per-facility aggregates over the neighbours of every cell, given the
+    owner and score found at each of the POSITIONS around it: neighbour
+    counts, neighbour score sums, the first position holding the facility,
+    and whether the facility can attack the cell from its preferred
+    direction. Each result has shape (facility, *owners.shape).
+    '''
+    shape = (facility_count, *owners.shape)
+    facilities = np.arange(facility_count).reshape((-1,) + (1,) * owners.ndim)
+
+    count = np.zeros(shape, dtype=np.int8)
+    total = np.zeros(shape)
+    first = np.full(shape, len(POSITIONS), dtype=np.int8)
+    for position in reversed(range(len(POSITIONS))):
+        one_hot = neighbour_owners[position] == facilities
+        count += one_hot
+        first[one_hot] = position
+    for position in range(len(POSITIONS)):
+        total += np.where(neighbour_owners[position] == facilities, neighbour_scores[position], 0)
+
+    attack = np.zeros(shape, dtype=bool)
+    for facility, position in enumerate(attack_positions):
+        attack[facility] = (neighbour_owners[position] == facility) & (owners != facility)
+    return count, total, first, attack
+
+def neighbourhood(
+    owners: np.ndarray,
+    scores: np.ndarray,
+):
+    '''
+    The owner and score rasters seen from each of the POSITIONS around
+    every cell, as 3x3-shifted windows over padded copies; `scores` holds
+    each cell's own score.
+    '''
+    height, width = owners.shape
+    padded_owners = np.pad(owners, 1, constant_values=EMPTY)
+    padded_scores = np.pad(scores, 1)
+    windows = tuple(
+        (slice(1 + dy, 1 + dy + height), slice(1 + dx, 1 + dx + width))
+        for dx, dy in POSITIONS
+    )
+    return (
+        [padded_owners[window] for window in windows],
+        [padded_scores[window] for window in windows],
+    )
+
+def _pick(
+    key: np.ndarray,
+    candidates: np.ndarray,
+    order: np.ndarray,
+    largest: bool,
+):
+    # Extreme of `key` over `candidates`; ties go to the facility with the
+    # largest `order` when maximizing and the smallest when minimizing,
+    # matching min() and sorted()[-1] over insertion-ordered dicts.
+    if largest:
+        best = np.where(candidates, key, -np.inf).max(axis=0)
+        tied = candidates & (key == best)
+        return np.where(tied, order, np.iinfo(order.dtype).min).argmax(axis=0), best
+    best = np.where(candidates, key, np.inf).min(axis=0)
+    tied = candidates & (key == best)
+    return np.where(tied, order, np.iinfo(order.dtype).max).argmin(axis=0), best
+
+def choose(
+    owners: np.ndarray,
+    count: np.ndarray,
+    total: np.ndarray,
+    first: np.ndarray,
+    attack: np.ndarray,
+    attack_positions: np.ndarray,
+    style: int,
+):
+    '''
+    Picks the new owner of every cell from the aggregates of
+    `neighbourhood`; the facility axis comes first and may be followed by
+    any cell shape. Cells that keep their owner, including empty ones,
+    keep their value.
+    '''
+    present = count > 0
+    mean = np.divide(total, count, out=np.zeros(total.shape), where=present)
+    order = np.broadcast_to(attack_positions.reshape((-1,) + (1,) * owners.ndim), attack.shape)
+    if style in (0, 1):
+        weakest, _ = _pick(mean, present, first, largest=False)
+    else:
+        weakest, _ = _pick(count, present, first, largest=False)
+    can_rank = (owners != EMPTY) & (weakest == owners)
+
+    match style:
+        case 0:
+            new_value, _ = _pick(mean, present, first, largest=True)
+            changes = can_rank
+        case 1:
+            new_value, best = _pick(mean, attack, order, largest=True)
+            changes = can_rank & attack.any(axis=0) & (best >= 0)
+        case 2:
+            new_value, _ = _pick(count, present, first, largest=True)
+            changes = can_rank
+        case 3:
+            new_value, _ = _pick(count, attack, order, largest=True)
+            changes = can_rank & attack.any(axis=0)
+    return np.where(changes, new_value, owners).astype(owners.dtype)
+
+def attack_positions(attack_offsets: tuple[tuple[int, int], ...]):
+    return np.array([POSITIONS.index(tuple(offset)) for offset in attack_offsets], dtype=np.int8)
+
+def propagate(
+    owners: np.ndarray,
+    scores: np.ndarray,
+    attack_offsets: tuple[tuple[int, int], ...],
+    style: int,
+):
+    '''
+    Vectorized synchronous counterpart of `sweep` over the whole grid.
+    '''
+    positions = attack_positions(attack_offsets)
+    neighbour_owners, neighbour_scores = neighbourhood(
+        owners=owners,
+        scores=cell_scores(owners, scores),
+    )
+    count, total, first, attack = aggregate(
+        owners=owners,
+        neighbour_owners=neighbour_owners,
+        neighbour_scores=neighbour_scores,
+        facility_count=scores.shape[0],
+        attack_positions=positions,
+    )
+    return choose(
+        owners=owners,
+        count=count,
+        total=total,
+        first=first,
+        attack=attack,
+        attack_positions=positions,
+        style=style,
+    )
+
+def propagate_at(
+    owners: np.ndarray,
+    scores: np.ndarray,
+    facility_count: int,
+    attack_offsets: tuple[tuple[int, int], ...],
+    style: int,
+    ys: np.ndarray,
+    xs: np.ndarray,
+):
+    '''
+    `propagate` restricted to the cells at (ys, xs), gathering their
+    neighbours instead of sweeping the grid; `scores` holds each cell's own
+    score. Returns the new owners of those cells.
+    '''
+    positions = attack_positions(attack_offsets)
+    padded_owners = np.pad(owners, 1, constant_values=EMPTY)
+    padded_scores = np.pad(scores, 1)
+    count, total, first, attack = aggregate(
+        owners=owners[ys, xs],
+        neighbour_owners=[padded_owners[ys + 1 + dy, xs + 1 + dx] for dx, dy in POSITIONS],
+        neighbour_scores=[padded_scores[ys + 1 + dy, xs + 1 + dx] for dx, dy in POSITIONS],
+        facility_count=facility_count,
+        attack_positions=positions,
+    )
+    return choose(
+        owners=owners[ys, xs],
+        count=count,
+        total=total,
+        first=first,
+        attack=attack,
+        attack_positions=positions,
+        style=style,
+    )
@@ -0,0 +1,286 @@
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from .constants import (
+    SHORT_TERM_DURATION,
+    LONG_TERM_DURATION,
+    HAS_INFLUX,
+    MINIMUM_AREA,
+    MAXIMUM_AREA,
+    PENALTY,
+    ADVANTAGE,
+    MAX_COLOR_VALUE,
+    INFLUX_EFFECT,
+)
+
+PARAMETER_NAMES = (
+    'short_term_wages',
+    'short_term_workers',
+    'long_term_wages',
+    'long_term_workers',
+    'solar_reduction',
+    'average_revenue',
+    'percent_solar',
+    'accessibility_factor',
+    'irrigation_factor',
+    'constant',
+    'construction_factor',
+    'deforestation_factor',
+    'operating_costs',
+    'utility_costs',
+    'taxation_factor',
+    'upper_carbon_limit',
+    'carbon_produced',
+)
+
+_SHORT_TERM_DURATION = float(SHORT_TERM_DURATION)
+_LONG_TERM_DURATION = float(LONG_TERM_DURATION)
+_MINIMUM_AREA = float(MINIMUM_AREA)
+_MAXIMUM_AREA = float(MAXIMUM_AREA)
+_PENALTY = float(PENALTY)
+_ADVANTAGE = float(ADVANTAGE)
+_MAX_COLOR_VALUE = float(MAX_COLOR_VALUE)
+_INFLUX_EFFECT = float(INFLUX_EFFECT)
+
+# Floating point types the vectorized scoring path can run in. float32
+# halves the memory traffic of the score rasters at the cost of about
+# seven significant digits; validate.py measures what that does to the
+# scores and rankings.
+PRECISIONS = dict(
+    float64=np.float64,
+    float32=np.float32,
+)
+
+# Scoring constants every table row also carries, so they can be varied
+# per facility or per variant like the workbook parameters.
+CONSTANT_NAMES = (
+    'penalty',
+    'advantage',
+)
+
+class FacilityTable:
+    __slots__ = ('names', 'colors', *PARAMETER_NAMES, *CONSTANT_NAMES)
+
+    def __init__(
+        self,
+        names: Iterable[str],
+        colors: Iterable[tuple[int, int, int]],
+        **parameters,
+    ):
+        self.names = tuple(names)
+        self.colors = np.asarray(tuple(colors), dtype=np.uint8).reshape(-1, 3)
+        for name in PARAMETER_NAMES:
+            setattr(self, name, np.asarray(parameters[name], dtype=np.float64))
+        defaults = dict(penalty=_PENALTY, advantage=_ADVANTAGE)
+        for name in CONSTANT_NAMES:
+            setattr(self, name, np.broadcast_to(
+                np.asarray(parameters.get(name, defaults[name]), dtype=np.float64),
+                (len(self.names),),
+            ).copy())
+
+    def __len__(self):
+        return len(self.names)
+
+    def columns(self):
+        return dict((name, getattr(self, name)) for name in (*PARAMETER_NAMES, *CONSTANT_NAMES))
+
+    def take(self, indices: Iterable[int]):
+        indices = np.asarray(tuple(indices), dtype=np.intp)
+        return FacilityTable(
+            names=(self.names[i] for i in indices),
+            colors=self.colors[indices],
+            **dict((name, column[indices]) for name, column in self.columns().items()),
+        )
+
+    def replace(self, **columns):
+        '''
+        A copy with the given columns replaced, e.g. one variant of a
+        parameter sweep.
+        '''
+        return FacilityTable(
+            names=self.names,
+            colors=self.colors,
+            **{**self.columns(), **columns},
+        )
+
+    @classmethod
+    def concatenate(cls, tables: Iterable['FacilityTable']):
+        tables = tuple(tables)
+        return cls(
+            names=(name for table in tables for name in table.names),
+            colors=np.concatenate([table.colors for table in tables]),
+            **dict(
+                (name, np.concatenate([getattr(table, name) for table in tables]))
+                for name in (*PARAMETER_NAMES, *CONSTANT_NAMES)
+            ),
+        )
+
+    @classmethod
+    def from_facilities(cls, facilities: Iterable[Any]):
+        facilities = tuple(facilities)
+        return cls(
+            names=(facility.name for facility in facilities),
+            colors=(facility.color for facility in facilities),
+            **dict(
+                (name, [float(getattr(facility, name)) for facility in facilities])
+                for name in PARAMETER_NAMES
+            ),
+        )
+
+def color_code_to_value(value: np.ndarray, dtype: np.dtype = np.float64):
+    return np.asarray(value, dtype=dtype) * 100 / _MAX_COLOR_VALUE
+
+def as_layers(named_maps: dict[str, Any], dtype: np.dtype = np.float64):
+    return dict(
+        (name, color_code_to_value(map, dtype))
+        for name, map in named_maps.items()
+    )
+
+def ldmr_multiplier(
+    area: np.ndarray,
+    dtype: np.dtype = np.float64,
+    penalty: np.ndarray | float = _PENALTY,
+    advantage: np.ndarray | float = _ADVANTAGE,
+):
+    area = np.asarray(area, dtype=dtype)
+    return np.where(
+        area < _MINIMUM_AREA,
+        np.exp(
+            -7 / _MINIMUM_AREA * area
+            + np.log(np.asarray(advantage, dtype=dtype) - 1)
+            + 7 / _MINIMUM_AREA
+        ),
+        np.where(
+            area > _MAXIMUM_AREA,
+            np.asarray(penalty, dtype=dtype) + 1 / (np.maximum(area, _MAXIMUM_AREA) - _MAXIMUM_AREA + 5),
+            1.0,
+        ),
+    )
+
+def _score(
+    parameter: Callable[[str], np.ndarray],
+    layers: dict[str, np.ndarray],
+    area: np.ndarray,
+    average_topography: np.ndarray,
+    has_influx: bool,
+    dtype: np.dtype,
+):
+    # An area of 0 stands for "no connected cells", mirroring the
+    # connected_cells=None branches of the Decimal formulas.
+    connected = area > 0
+    area_ = np.where(connected, area, 1.0)
+    average_topography = np.where(connected, average_topography, 1.0)
+
+    short_term_benefits = parameter('short_term_wages') * parameter('short_term_workers')
+    revenue = (
+        (1 + layers['cell_coverage'])
+        * parameter('average_revenue')
+        * (_INFLUX_EFFECT if has_influx else 1)
+    )
+    clean_energy_benefits = parameter('solar_reduction') * (
+        2 / 3 * parameter('percent_solar') ** 2.5 - 1 / 3
+    )
+    long_term_benefits = (
+        revenue
+        + parameter('long_term_wages') * parameter('long_term_workers')
+        + clean_energy_benefits
+    )
+
+    topography_ratio = np.divide(
+        layers['topography'],
+        average_topography,
+        out=np.zeros(
+            np.broadcast_shapes(np.shape(layers['topography']), np.shape(average_topography)),
+            dtype=dtype,
+        ),
+        where=average_topography != 0,
+    )
+    construction_price = area_ * parameter('construction_factor') * (
+        1 - np.abs(1 - parameter('constant') * topography_ratio)
+    )
+    short_term_costs = (
+        parameter('accessibility_factor') * layers['distance_from_road']
+        + parameter('irrigation_factor') * layers['distance_from_water']
+        + parameter('deforestation_factor') * layers['tree_cover']
+        + construction_price
+        + short_term_benefits
+    )
+    carbon_taxation = area_ * parameter('taxation_factor') * np.maximum(
+        0, parameter('carbon_produced') - parameter('upper_carbon_limit')
+    )
+    long_term_costs = parameter('operating_costs') + parameter('utility_costs') + carbon_taxation
+
+    return (
+        (
+            short_term_benefits * _SHORT_TERM_DURATION
+            + long_term_benefits * _LONG_TERM_DURATION
+        ) / (
+            short_term_costs * _SHORT_TERM_DURATION
+            + long_term_costs * _LONG_TERM_DURATION
+        ) * np.where(
+            connected,
+            ldmr_multiplier(
+                area=area_,
+                dtype=dtype,
+                penalty=parameter('penalty'),
+                advantage=parameter('advantage'),
+            ),
+            1.0,
+        )
+    )
+
+def score_raster(
+    table: FacilityTable,
+    layers: dict[str, np.ndarray],
+    area: Optional[np.ndarray] = None,
+    average_topography: Optional[np.ndarray] = None,
+    has_influx: bool = HAS_INFLUX,
+    dtype: np.dtype = np.float64,
+):
+    '''
+    Scores every facility of `table` on every cell at once, returning a
+    (facility, row, column) raster. `area` and `average_topography` must
+    broadcast against that shape; cells with an area of 0 are scored as
+    if they had no connected cells. Layers should already be of `dtype`,
+    or the arithmetic is promoted to theirs.
+    '''
+    area = np.zeros((), dtype=dtype) if area is None else np.asarray(area, dtype=dtype)
+    average_topography = np.ones((), dtype=dtype) if average_topography is None else np.asarray(
+        average_topography, dtype=dtype
+    )
+    return _score(
+        parameter=lambda name: getattr(table, name).astype(dtype)[:, None, None],
+        layers=layers,
+        area=area,
+        average_topography=average_topography,
+        has_influx=has_influx,
+        dtype=dtype,
+    )
+
+def score_cells(
+    table: FacilityTable,
+    owners: np.ndarray,
+    layers: dict[str, np.ndarray],
+    area: Optional[np.ndarray] = None,
+    average_topography: Optional[np.ndarray] = None,
+    has_influx: bool = HAS_INFLUX,
+    dtype: np.dtype = np.float64,
+):
+    '''
+    Elementwise counterpart of `score_raster`: scores facility `owners[i]`
+    against `layers[name][i]` for every i.
+    '''
+    owners = np.asarray(owners, dtype=np.intp)
+    area = np.zeros((), dtype=dtype) if area is None else np.asarray(area, dtype=dtype)
+    average_topography = np.ones((), dtype=dtype) if average_topography is None else np.asarray(
+        average_topography, dtype=dtype
+    )
+    return _score(
+        parameter=lambda name: getattr(table, name).astype(dtype)[owners],
+        layers=layers,
+        area=area,
+        average_topography=average_topography,
+        has_influx=has_influx,
+        dtype=dtype,
+    )
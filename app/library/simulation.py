@@ -0,0 +1,98 @@
+from threading import (
+    Event,
+    Thread,
+)
+from time import monotonic
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from . import Grid
+from .constants import PROPAGATION_STYLE_CHOICES
+from .directions import Directions
+
+class Snapshot(NamedTuple):
+    step: int
+    owners: np.ndarray
+    score: Optional[float]
+
+def freeze(owners: np.ndarray):
+    owners = owners.copy()
+    owners.setflags(write=False)
+    return owners
+
+class Simulation(Thread):
+    '''
+    Steps a grid on a background thread and publishes a read-only copy of
+    its owners after every step as `snapshot`, so readers never see a grid
+    halfway through an update. Starts paused; steps are at least `interval`
+    seconds apart. Steps are synchronous, and incremental unless
+    `incremental` is False.
+    '''
+    snapshot: Snapshot
+
+    def __init__(
+        self,
+        grid: Grid,
+        directions: Directions,
+        attack_directions: dict[str, tuple[int, int]],
+        interval: float = 0.0,
+        style: Optional[int] = None,
+        on_step: Optional[Callable[[Snapshot], None]] = None,
+        incremental: bool = True,
+    ):
+        super().__init__(daemon=True)
+        self.grid = grid
+        self.directions = directions
+        self.attack_directions = attack_directions
+        self.interval = interval
+        self.style = style
+        self.on_step = on_step
+        self.incremental = incremental
+        self.running = Event()
+        self.stopping = Event()
+        self.snapshot = Snapshot(step=0, owners=freeze(grid.owners), score=None)
+
+    @property
+    def paused(self):
+        return not self.running.is_set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def toggle(self):
+        if self.paused:
+            self.resume()
+        else:
+            self.pause()
+
+    def stop(self):
+        self.stopping.set()
+        self.running.set()
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self.running.wait(timeout=0.1) or self.stopping.is_set():
+                continue
+            started = monotonic()
+            score = self.grid.update(
+                attack_directions=self.attack_directions,
+                directions=self.directions,
+                style=int(self.grid.rng.choice(PROPAGATION_STYLE_CHOICES)) if self.style is None else self.style,
+                # The in-place sweep is pure Python and would hold the GIL
+                # for the whole step; the vectorized paths mostly run in
+                # numpy and leave the window thread room to draw.
+                synchronous=True,
+                incremental=self.incremental,
+            )
+            self.snapshot = Snapshot(
+                step=self.snapshot.step + 1,
+                owners=freeze(self.grid.owners),
+                score=score,
+            )
+            if self.on_step is not None:
+                self.on_step(self.snapshot)
+            self.stopping.wait(max(0.0, self.interval - (monotonic() - started)))
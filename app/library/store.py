@@ -0,0 +1,66 @@
+from decimal import Decimal
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from . import Facility
+from .directions import Directions
+from .parallel import (
+    SharedStore,
+    attach_store,
+)
+from .scoring import (
+    PARAMETER_NAMES,
+    FacilityTable,
+)
+
+class Layers(NamedTuple):
+    layers: dict[str, np.ndarray]
+    mask: np.ndarray
+    directions: Directions
+    facilities: tuple[Facility, ...]
+
+def publish(
+    layers: dict[str, np.ndarray],
+    mask: np.ndarray,
+    directions: Directions,
+    facilities: Iterable[Facility],
+):
+    '''
+    Publishes the converted map layers, the mask, the direction raster
+    and the facility parameter table into shared memory once; workers
+    get them back from the store's spec with `attach_layers`.
+    '''
+    table = FacilityTable.from_facilities(facilities)
+    return SharedStore(
+        arrays=dict(
+            **dict((f'layer/{name}', layer) for name, layer in layers.items()),
+            mask=mask,
+            directions=directions.ids,
+            parameters=np.stack([getattr(table, name) for name in PARAMETER_NAMES]),
+        ),
+        metadata=dict(
+            names=table.names,
+            colors=tuple(map(tuple, table.colors.tolist())),
+            direction_labels=directions.labels,
+        ),
+    )
+
+def attach_layers(spec: tuple):
+    arrays, metadata = attach_store(spec)
+    facilities = tuple(
+        Facility(name=name, color=color)
+        for name, color in zip(metadata['names'], metadata['colors'])
+    )
+    for name, values in zip(PARAMETER_NAMES, arrays['parameters']):
+        for facility, value in zip(facilities, values.tolist()):
+            setattr(facility, name, Decimal(value))
+    return Layers(
+        layers=dict(
+            (name.removeprefix('layer/'), array)
+            for name, array in arrays.items() if name.startswith('layer/')
+        ),
+        mask=arrays['mask'],
+        directions=Directions(ids=arrays['directions'], labels=metadata['direction_labels']),
+        facilities=facilities,
+    )
@@ -0,0 +1,112 @@
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from . import (
+    Facility,
+    candidates,
+)
+from .components import (
+    EMPTY,
+    OWNER_DTYPE,
+)
+from .scoring import (
+    CONSTANT_NAMES,
+    PARAMETER_NAMES,
+    FacilityTable,
+    score_raster,
+)
+
+# Every column of a facility table a sweep can vary.
+SWEEP_NAMES = (*PARAMETER_NAMES, *CONSTANT_NAMES)
+
+class Variant(NamedTuple):
+    # None for the baseline, which every other variant is compared to.
+    parameter: Optional[str]
+    factor: float
+
+def variants(parameters: Iterable[str], factors: Iterable[float]):
+    '''
+    The baseline, then one variant per parameter and factor, each scaling
+    that parameter of every facility by the factor.
+    '''
+    factors = tuple(factor for factor in factors if factor != 1)
+    for factor in factors:
+        if factor <= 0:
+            raise ValueError(f'Factor {factor} is not positive')
+    return (Variant(parameter=None, factor=1.0), *(
+        Variant(parameter=parameter, factor=float(factor))
+        for parameter in parameters
+        for factor in factors
+    ))
+
+def variant_table(table: FacilityTable, variant: Variant):
+    if variant.parameter is None:
+        return table
+    values = getattr(table, variant.parameter) * variant.factor
+    # The small region multiplier takes the log of advantage - 1.
+    if variant.parameter == 'advantage' and (values <= 1).any():
+        raise ValueError(f'Factor {variant.factor} takes advantage to {values.min()}, which must stay above 1')
+    return table.replace(**{variant.parameter: values})
+
+def static_owners(
+    facilities: tuple[Facility, ...],
+    table: FacilityTable,
+    sweep: Iterable[Variant],
+    layers: dict[str, np.ndarray],
+    mask: np.ndarray,
+    dtype: np.dtype = np.float64,
+):
+    '''
+    The best scoring facility of every cell under every variant, ignoring
+    regions, as a (variant, row, column) raster. All variants are scored
+    in one pass over a table of every variant stacked, so the map terms
+    are computed once for all of them. This is a side measure for the
+    sensitivity table only: the runs score their own variant every step.
+    '''
+    indices = candidates(facilities)
+    sweep = tuple(sweep)
+    stacked = FacilityTable.concatenate(
+        variant_table(table, variant).take(indices) for variant in sweep
+    )
+    scores = score_raster(table=stacked, layers=layers, dtype=dtype)
+    scores = scores.reshape(len(sweep), indices.size, *mask.shape)
+    owners = indices[scores.argmax(axis=1)].astype(OWNER_DTYPE)
+    owners[:, ~mask] = EMPTY
+    return owners
+
+def shares(owners: np.ndarray, facility_count: int):
+    occupied = owners != EMPTY
+    return np.bincount(owners[occupied].astype(np.int64), minlength=facility_count) / max(1, occupied.sum())
+
+def sensitivity(
+    variant: Variant,
+    score: float,
+    owners: np.ndarray,
+    static: np.ndarray,
+    baseline_score: float,
+    baseline_owners: np.ndarray,
+    baseline_static: np.ndarray,
+    facility_names: tuple[str, ...],
+):
+    '''
+    One row of the sensitivity table: the relative change of the final
+    average score against the baseline and its elasticity, the share of
+    cells whose owner changed, with and without regions, and the facility
+    whose share of the map moved the most.
+    '''
+    occupied = baseline_owners != EMPTY
+    change = (score - baseline_score) / abs(baseline_score) if baseline_score else float('nan')
+    share_change = shares(owners, len(facility_names)) - shares(baseline_owners, len(facility_names))
+    most_affected = int(np.abs(share_change).argmax())
+    return dict(
+        parameter=variant.parameter,
+        factor=variant.factor,
+        score=score,
+        score_change=change,
+        elasticity=change / (variant.factor - 1) if variant.factor != 1 else float('nan'),
+        cells_changed=float((owners != baseline_owners)[occupied].mean()) if occupied.any() else 0.0,
+        static_cells_changed=float((static != baseline_static)[occupied].mean()) if occupied.any() else 0.0,
+        most_affected=facility_names[most_affected],
+        share_change=float(share_change[most_affected]),
+    )
@@ -0,0 +1,240 @@
+from os import makedirs, path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from . import (
+    Facility,
+    initial_owners,
+)
+from .components import (
+    EMPTY,
+    OWNER_DTYPE,
+    _find_roots,
+    label_components,
+)
+from .directions import Directions
+from .profiling import Profiler
+from .propagation import (
+    cell_scores,
+    propagate,
+)
+from .scoring import (
+    FacilityTable,
+    as_layers,
+    score_raster,
+)
+
+def tiles(shape: tuple[int, int], size: int):
+    for top in range(0, shape[0], size):
+        for left in range(0, shape[1], size):
+            yield top, min(top + size, shape[0]), left, min(left + size, shape[1])
+
+class TiledGrid:
+    '''
+    Synchronous counterpart of Grid for regions too large to hold in
+    memory. The map layers stay as the (memory-mapped) uint8 arrays they
+    are loaded as, while owners and component labels live in .npy
+    memory maps under `directory`. Every pass walks the grid tile by
+    tile: labelling runs per tile and is stitched across tile edges,
+    and scoring and propagation read each tile with a one-cell halo.
+    Only the tables of the components that touch tile edges are held
+    whole.
+    '''
+    def __init__(
+        self,
+        named_maps: dict[str, Any],
+        facilities: Iterable[Facility],
+        directory: str,
+        tile_size: int = 256,
+        rng: Optional[np.random.Generator] = None,
+        profiler: Optional[Profiler] = None,
+        dtype: np.dtype = np.float64,
+    ):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.profiler = Profiler() if profiler is None else profiler
+        self.named_maps = named_maps
+        self.facilities = tuple(facilities)
+        self.table = FacilityTable.from_facilities(self.facilities)
+        self.tile_size = tile_size
+        self.dtype = np.dtype(dtype)
+        self.shape = next(iter(named_maps.values())).shape
+        makedirs(directory, exist_ok=True)
+        self.owners = open_memmap(path.join(directory, 'owners.npy'), 'w+', OWNER_DTYPE, self.shape)
+        self.next_owners = open_memmap(path.join(directory, 'owners-next.npy'), 'w+', OWNER_DTYPE, self.shape)
+        self.labels = open_memmap(path.join(directory, 'labels.npy'), 'w+', np.int64, self.shape)
+        # Initial owners are drawn in full-width bands of rows, so the
+        # random draws reach the cells in the same order as in Grid.
+        for top in range(0, self.shape[0], self.tile_size):
+            window = (slice(top, top + self.tile_size), slice(None))
+            maps = self.maps(window)
+            self.owners[window] = initial_owners(
+                facilities=self.facilities,
+                layers=as_layers(maps, self.dtype),
+                mask=np.logical_or.reduce([map != 0 for map in maps.values()]),
+                rng=self.rng,
+                dtype=self.dtype,
+            )
+        self.flips = 0
+
+    def tiles(self):
+        return tiles(self.shape, self.tile_size)
+
+    def maps(self, window: tuple[slice, slice]):
+        return dict((name, np.asarray(map[window])) for name, map in self.named_maps.items())
+
+    def load_owners(self, owners: np.ndarray):
+        for top, bottom, left, right in self.tiles():
+            self.owners[top:bottom, left:right] = owners[top:bottom, left:right]
+
+    def label_tile(self, window: tuple[slice, slice]):
+        '''
+        Labels the tile at `window` on its own; returns its labels, with
+        the area and topography sum of every label.
+        '''
+        labels, area, _ = label_components(np.asarray(self.owners[window]))
+        topography = as_layers(dict(topography=self.named_maps['topography'][window]))['topography']
+        topography_sum = np.bincount(labels.ravel(), weights=topography.ravel(), minlength=area.size)
+        return labels, area, topography_sum
+
+    def label(self, directions: Directions):
+        '''
+        Labels every tile on its own, then merges the labels of equal
+        owners that meet across tile edges. Only labels that touch a tile
+        edge can merge, so only those get a label in the `labels` memory
+        map (0 elsewhere) and a row in the tables held whole: the root
+        label of every edge label in `roots`, and the area and topography
+        sum of every root. Regions within a tile are labelled again when
+        the tile is scored. Also leaves the direction histogram of every
+        facility.
+        '''
+        direction_count = len(directions.labels)
+        histogram = np.zeros(len(self.facilities) * direction_count, dtype=np.int64)
+        areas = [np.zeros(1, dtype=np.int64)]
+        topography_sums = [np.zeros(1)]
+        count = 1
+        self.interior_count = 0
+        for top, bottom, left, right in self.tiles():
+            window = (slice(top, bottom), slice(left, right))
+            labels, area, topography_sum = self.label_tile(window)
+            edge = np.zeros(area.size, dtype=bool)
+            for border in (labels[0], labels[-1], labels[:, 0], labels[:, -1]):
+                edge[border] = True
+            edge[0] = False
+            numbers = np.zeros(area.size, dtype=np.int64)
+            numbers[edge] = np.arange(count, count + edge.sum())
+            self.labels[window] = numbers[labels]
+            areas.append(area[edge])
+            topography_sums.append(topography_sum[edge])
+            count += int(edge.sum())
+            self.interior_count += area.size - 1 - int(edge.sum())
+            owners = np.asarray(self.owners[window])
+            occupied = owners != EMPTY
+            histogram += np.bincount(
+                owners[occupied].astype(np.int64) * direction_count + directions.ids[window][occupied],
+                minlength=histogram.size,
+            )
+
+        u = []
+        v = []
+        for edge in range(self.tile_size, self.shape[0], self.tile_size):
+            above, below = np.asarray(self.owners[edge - 1]), np.asarray(self.owners[edge])
+            same = (above == below) & (above != EMPTY)
+            u.append(np.asarray(self.labels[edge - 1])[same])
+            v.append(np.asarray(self.labels[edge])[same])
+        for edge in range(self.tile_size, self.shape[1], self.tile_size):
+            before, after = np.asarray(self.owners[:, edge - 1]), np.asarray(self.owners[:, edge])
+            same = (before == after) & (before != EMPTY)
+            u.append(np.asarray(self.labels[:, edge - 1])[same])
+            v.append(np.asarray(self.labels[:, edge])[same])
+        self.roots = _find_roots(
+            size=count,
+            u=np.concatenate([np.zeros(0, dtype=np.int64), *u]),
+            v=np.concatenate([np.zeros(0, dtype=np.int64), *v]),
+        )
+        self.area = np.bincount(self.roots, weights=np.concatenate(areas), minlength=count)
+        self.topography_sum = np.bincount(self.roots, weights=np.concatenate(topography_sums), minlength=count)
+        self.histogram = histogram.reshape(len(self.facilities), direction_count)
+
+    @property
+    def component_count(self):
+        return self.interior_count + int((self.area > 0).sum())
+
+    def update(
+        self,
+        attack_directions: dict[str, tuple[int, int]],
+        directions: Directions,
+        style: int,
+        **_,
+    ):
+        self.profiler.start()
+        with self.profiler.phase('components'):
+            self.label(directions)
+        self.profiler.count('components', self.component_count)
+        with self.profiler.phase('directions'):
+            self.preferred_direction = tuple(
+                directions.labels[direction] for direction in self.histogram.argmax(axis=1)
+            )
+        attack_offsets = tuple(attack_directions[direction] for direction in self.preferred_direction)
+        average_topography = self.topography_sum / np.maximum(self.area, 1)
+
+        total_score = 0.0
+        occupied_count = 0
+        flips = 0
+        height, width = self.shape
+        for top, bottom, left, right in self.tiles():
+            # The tile with a one-cell halo, and the tile within it.
+            window = (
+                slice(max(0, top - 1), min(height, bottom + 1)),
+                slice(max(0, left - 1), min(width, right + 1)),
+            )
+            inner = (
+                slice(top - window[0].start, bottom - window[0].start),
+                slice(left - window[1].start, right - window[1].start),
+            )
+            owners = np.asarray(self.owners[window])
+            with self.profiler.phase('components'):
+                # Halo cells lie on the edges of the neighbouring tiles,
+                # so only the tile's own interior regions lack an edge
+                # label.
+                roots = self.roots[np.asarray(self.labels[window])]
+                area = self.area[roots]
+                topography = average_topography[roots]
+                labels, tile_area, tile_topography_sum = self.label_tile((slice(top, bottom), slice(left, right)))
+                interior = (roots[inner] == 0) & (labels > 0)
+                area[inner][interior] = tile_area[labels[interior]]
+                topography[inner][interior] = tile_topography_sum[labels[interior]] / tile_area[labels[interior]]
+            with self.profiler.phase('scoring'):
+                scores = score_raster(
+                    table=self.table,
+                    layers=as_layers(self.maps(window), self.dtype),
+                    area=area,
+                    average_topography=topography,
+                    dtype=self.dtype,
+                )
+                occupied = owners[inner] != EMPTY
+                total_score += float(cell_scores(owners, scores)[inner][occupied].sum())
+                occupied_count += int(occupied.sum())
+            with self.profiler.phase('propagation'):
+                new_owners = propagate(
+                    owners=owners,
+                    scores=scores,
+                    attack_offsets=attack_offsets,
+                    style=style,
+                )
+            self.next_owners[top:bottom, left:right] = new_owners[inner]
+            flips += int((new_owners[inner] != owners[inner]).sum())
+        self.owners, self.next_owners = self.next_owners, self.owners
+        self.flips = flips
+
+        average_score = total_score / max(1, occupied_count)
+        self.profiler.count('cells_rescored', occupied_count)
+        self.profiler.count('cells_evaluated', occupied_count)
+        self.profiler.count('flips', flips)
+        self.profiler.finish(style=style, score=average_score)
+        return average_score
+
+    def flush(self):
+        for memmap in (self.owners, self.next_owners, self.labels):
+            memmap.flush()
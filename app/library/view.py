@@ -0,0 +1,93 @@
+from pyglet.canvas import get_display
+from pyglet.gl import GL_NEAREST
+from pyglet.graphics import Batch
+from pyglet.image import (
+    ImageData,
+    Texture,
+)
+from pyglet.sprite import Sprite
+from pyglet.window import Window
+from typing import Sequence
+
+import numpy as np
+
+def center(window: Window):
+    screen = get_display().get_screens()[0]
+    x = screen.width // 2 - window.width // 2
+    window.set_location(x, 50)
+
+class View:
+    '''
+    Draws the grid as a single texture with one texel per cell, scaled up
+    by `resolution`. Cells that differ in the owners passed to `show` are
+    uploaded by `refresh` as one sub-image covering all of them.
+    '''
+    texture: Texture
+    sprite: Sprite
+
+    def __init__(
+        self,
+        owners: np.ndarray,
+        colors: Sequence[tuple[int, int, int]],
+        resolution: int,
+        height: int,
+        batch: Batch,
+    ):
+        self.owners = owners.copy()
+        rows, columns = self.owners.shape
+        # One RGBA entry per facility; the trailing entry, picked by EMPTY
+        # (-1), stays transparent.
+        self.palette = np.zeros((len(colors) + 1, 4), dtype=np.uint8)
+        self.palette[:-1, :3] = colors
+        self.palette[:-1, 3] = 255
+        self.dirty = np.zeros(self.owners.shape, dtype=bool)
+
+        self.texture = Texture.create(
+            columns,
+            rows,
+            min_filter=GL_NEAREST,
+            mag_filter=GL_NEAREST,
+        )
+        self.texture.blit_into(self.image(0, rows, 0, columns), 0, 0, 0)
+        self.sprite = Sprite(
+            self.texture,
+            x=0,
+            y=height - (rows - 1) * resolution,
+            batch=batch,
+        )
+        self.sprite.scale = resolution
+
+    def image(
+        self,
+        top: int,
+        bottom: int,
+        left: int,
+        right: int,
+    ):
+        # Image rows run bottom-up while grid rows run top-down.
+        pixels = self.palette[self.owners[top:bottom, left:right]][::-1]
+        return ImageData(
+            right - left,
+            bottom - top,
+            'RGBA',
+            np.ascontiguousarray(pixels).tobytes(),
+        )
+
+    def show(self, owners: np.ndarray):
+        if owners is not self.owners:
+            self.dirty |= owners != self.owners
+            self.owners = owners
+
+    def refresh(self):
+        ys, xs = np.nonzero(self.dirty)
+        if not ys.size:
+            return
+        top, bottom = int(ys.min()), int(ys.max()) + 1
+        left, right = int(xs.min()), int(xs.max()) + 1
+        self.texture.blit_into(
+            self.image(top, bottom, left, right),
+            left,
+            self.owners.shape[0] - bottom,
+            0,
+        )
+        self.dirty[top:bottom, left:right] = False
@@ -0,0 +1,88 @@
+'''
+Plays back a trajectory written by `run.py --trajectory` in the viewer,
+without scoring anything, e.g.
+
+    python replay.py run.traj --start 500 --speed 4
+'''
+from argparse import ArgumentParser
+
+from pyglet.app import run
+from pyglet.clock import schedule_interval
+from pyglet.graphics import Batch
+from pyglet.window import Window
+
+from constants import (
+    WIDTH,
+    HEIGHT,
+    CAPTION,
+    FRAME_INTERVAL,
+    RESOLUTION,
+)
+from library.view import (
+    View,
+    center,
+)
+from utils.trajectory import TrajectoryReader
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description='Replay a logged run.')
+    parser.add_argument('trajectory')
+    parser.add_argument('--start', type=int, default=None, help='step to start from; the first logged by default')
+    parser.add_argument('--speed', type=int, default=1, help='steps per frame')
+    parser.add_argument(
+        '--resolution',
+        type=int,
+        default=None,
+        help='resolution the run used; read from the trajectory by default',
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    reader = TrajectoryReader(arguments.trajectory)
+    frames = reader.frames(arguments.start)
+    _, owners = next(frames)
+
+    window = Window(width=WIDTH, height=HEIGHT)
+    window.set_caption(caption=f'{CAPTION} (replay)')
+    center(window)
+    batch = Batch()
+    view = View(
+        owners=owners,
+        colors=[tuple(color) for color in reader.header['colors']],
+        resolution=next(
+            resolution
+            for resolution in (arguments.resolution, reader.resolution, RESOLUTION)
+            if resolution is not None
+        ),
+        height=HEIGHT,
+        batch=batch,
+    )
+    state = dict(paused=True)
+
+    @window.event
+    def on_key_press(symbol, modifier):
+        state['paused'] = not state['paused']
+
+    def advance(dt):
+        if state['paused']:
+            return
+        for _ in range(arguments.speed):
+            frame = next(frames, None)
+            if frame is None:
+                state['paused'] = True
+                break
+            view.show(frame[1])
+
+    @window.event
+    def on_draw():
+        window.clear()
+        view.refresh()
+        batch.draw()
+
+    schedule_interval(advance, FRAME_INTERVAL)
+    run(FRAME_INTERVAL)
+    reader.close()
+
+if __name__ == '__main__':
+    main()
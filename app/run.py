@@ -0,0 +1,399 @@
+'''
+Runs the placer without a window, e.g.
+
+    python run.py --steps 200 --out result.npz
+'''
+from argparse import ArgumentParser
+from os import path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from constants import (
+    VALUES_PATH,
+    VALUES_SHEETNAMES,
+    CACHE_DIRECTORY,
+    FACILITIES,
+    IMAGE_DATA,
+    RESOLUTION,
+    SEED,
+    ATTACK_DIRECTIONS,
+    DIRECTIONS_PATH,
+    DIRECTIONS_SHEET,
+    DIRECTIONS_RESOLUTION,
+)
+from library import Grid
+from library.annealing import Annealer
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.convergence import Convergence
+from library.directions import Directions
+from library.multiresolution import seed
+from library.profiling import JsonLines
+from library.scoring import PRECISIONS
+from library.tiled import TiledGrid
+from library.parallel import StripePool
+from utils import (
+    assign_parameters,
+    initialize,
+    get_directions,
+    load_named_maps,
+)
+from utils.checkpoint import (
+    CheckpointWriter,
+    load_checkpoint,
+    restore,
+)
+from utils.trajectory import TrajectoryWriter
+from utils.workbook import load_parameters
+
+def simulate(
+    grid: Grid,
+    directions: Directions,
+    styles: Iterable[int],
+    convergence: Optional[Convergence] = None,
+    synchronous: bool = False,
+    pool: Optional[StripePool] = None,
+    incremental: bool = False,
+):
+    '''
+    Steps `grid` once per style in `styles`, yielding the style, the
+    average score and the number of flipped cells of every step. Stops
+    early once `convergence` reports the run converged.
+    '''
+    for style in styles:
+        score = grid.update(
+            attack_directions=ATTACK_DIRECTIONS,
+            directions=directions,
+            style=style,
+            synchronous=synchronous,
+            pool=pool,
+            incremental=incremental,
+        )
+        flips = grid.flips
+        yield style, score, flips
+        if convergence is not None and convergence.update(flips=flips, score=score):
+            break
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description='Run the facility placer headless.')
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument(
+        '--style',
+        type=int,
+        choices=PROPAGATION_STYLE_CHOICES,
+        default=None,
+        help='propagation style for every step; a random one per step if omitted',
+    )
+    parser.add_argument('--resolution', type=int, default=RESOLUTION)
+    parser.add_argument(
+        '--levels',
+        type=int,
+        nargs='*',
+        default=[],
+        help='coarser resolutions to solve first, coarsest first, each a multiple of the next',
+    )
+    parser.add_argument(
+        '--tile-size',
+        type=int,
+        default=0,
+        help='step synchronously over memory-mapped state in tiles of this many cells a side',
+    )
+    parser.add_argument('--tile-directory', default=path.join(CACHE_DIRECTORY, 'tiles'))
+    parser.add_argument('--level-steps', type=int, default=100, help='step limit of every coarser level')
+    parser.add_argument('--seed', type=int, default=SEED, help='seed of the initial grid and style choices')
+    parser.add_argument(
+        '--precision',
+        choices=tuple(PRECISIONS),
+        default='float64',
+        help='floating point type to score in',
+    )
+    parser.add_argument(
+        '--synchronous',
+        action='store_true',
+        help='compute every step from the previous generation instead of in place',
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=1,
+        help='sweep row stripes across this many processes (implies --synchronous; not with --incremental)',
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='synchronous steps that only re-evaluate cells near the last flips',
+    )
+    parser.add_argument(
+        '--until-stable',
+        action='store_true',
+        help='stop before --steps once the run converges',
+    )
+    parser.add_argument('--flip-threshold', type=int, default=0)
+    parser.add_argument('--score-threshold', type=float, default=None)
+    parser.add_argument('--patience', type=int, default=len(PROPAGATION_STYLE_CHOICES))
+    parser.add_argument(
+        '--anneal',
+        type=int,
+        default=0,
+        help='single-cell moves of delta-scored local search to run after the steps',
+    )
+    parser.add_argument(
+        '--temperature',
+        type=float,
+        default=0.0,
+        help='starting temperature of --anneal, relative to the average cell score; 0 only takes improving moves',
+    )
+    parser.add_argument('--cooling', type=float, default=1.0, help='factor the temperature is multiplied by every move')
+    parser.add_argument('--out', default=None, help='.npz file to write the final grid to')
+    parser.add_argument('--checkpoint', default=None, help='.npz file to write checkpoints to')
+    parser.add_argument(
+        '--checkpoint-every',
+        type=int,
+        default=0,
+        help='also checkpoint every this many steps, not only at the end',
+    )
+    parser.add_argument('--trajectory', default=None, help='file to log the changed cells of every step to')
+    parser.add_argument('--keyframe-interval', type=int, default=64)
+    parser.add_argument('--resume', default=None, help='checkpoint to continue from')
+    parser.add_argument('--profile', default=None, help='.jsonl file to write per-step phase timings to')
+    parser.add_argument('--quiet', action='store_true')
+    return parser.parse_args(argv)
+
+def load(
+    resolution: int,
+    rng: np.random.Generator,
+    dtype: np.dtype = np.float64,
+    area_scale: float = 1.0,
+):
+    grid, _ = initialize(
+        facility_parameters=load_parameters(
+            workbook_path=VALUES_PATH,
+            sheetnames=VALUES_SHEETNAMES,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+        facilities=FACILITIES,
+        image_data=IMAGE_DATA,
+        resolution=resolution,
+        cache_directory=CACHE_DIRECTORY,
+        rng=rng,
+        dtype=dtype,
+        area_scale=area_scale,
+    )
+    directions = get_directions(
+        DIRECTIONS_PATH,
+        DIRECTIONS_SHEET,
+        grid.owners.shape[1],
+        grid.owners.shape[0],
+        resolution,
+        cache_directory=CACHE_DIRECTORY,
+    )
+    return grid, directions
+
+def load_tiled(
+    resolution: int,
+    tile_size: int,
+    directory: str,
+    rng: np.random.Generator,
+    dtype: np.dtype = np.float64,
+):
+    assign_parameters(
+        FACILITIES,
+        load_parameters(
+            workbook_path=VALUES_PATH,
+            sheetnames=VALUES_SHEETNAMES,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+    )
+    grid = TiledGrid(
+        named_maps=load_named_maps(
+            image_data=IMAGE_DATA,
+            resolution=resolution,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+        facilities=FACILITIES,
+        directory=directory,
+        tile_size=tile_size,
+        rng=rng,
+        dtype=dtype,
+    )
+    directions = get_directions(
+        DIRECTIONS_PATH,
+        DIRECTIONS_SHEET,
+        grid.shape[1],
+        grid.shape[0],
+        resolution,
+        cache_directory=CACHE_DIRECTORY,
+    )
+    return grid, directions
+
+def coarse_to_fine(
+    levels: Iterable[int],
+    resolution: int,
+    rng: np.random.Generator,
+    steps: int,
+    convergence: Callable[[], Convergence],
+    quiet: bool = False,
+    dtype: np.dtype = np.float64,
+):
+    '''
+    Solves at every resolution of `levels`, coarsest first, each seeded
+    with the upsampled result of the one before, and returns the grid at
+    `resolution` seeded the same way. Every level runs incremental steps,
+    which start from the cells on region boundaries. Region areas are
+    scored in cells of `resolution` at every level, so each level
+    optimises the same objective as the last.
+    '''
+    owners = None
+    previous = None
+    for level in (*levels, resolution):
+        grid, directions = load(level, rng, dtype, area_scale=(level / resolution) ** 2)
+        if owners is not None:
+            grid.load_owners(seed(owners, previous // level, grid.owners))
+        if level == resolution:
+            return grid, directions
+        history = list(simulate(
+            grid=grid,
+            directions=directions,
+            styles=(int(rng.choice(PROPAGATION_STYLE_CHOICES)) for _ in range(steps)),
+            convergence=convergence(),
+            incremental=True,
+        ))
+        if not quiet:
+            print('level', level, len(history), history[-1][1] if history else None)
+        owners = grid.owners
+        previous = level
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    for coarse, fine in zip(arguments.levels, (*arguments.levels[1:], arguments.resolution)):
+        if coarse <= fine or coarse % fine:
+            raise ValueError(f'Resolution {coarse} is not a coarser multiple of {fine}')
+    if arguments.resolution < DIRECTIONS_RESOLUTION:
+        raise ValueError(
+            f'Resolution {arguments.resolution} is finer than the directions, '
+            f'which are given every {DIRECTIONS_RESOLUTION} pixels'
+        )
+    if arguments.tile_size and any([
+        arguments.levels,
+        arguments.incremental,
+        arguments.processes > 1,
+        arguments.resume,
+        arguments.checkpoint,
+        arguments.trajectory,
+        arguments.anneal,
+    ]):
+        raise ValueError('Tiled runs only support plain synchronous steps')
+    if arguments.incremental and arguments.processes > 1:
+        # Incremental steps only rescore the cells near the last flips,
+        # which the stripe workers have no use for.
+        raise ValueError('Incremental steps run in a single process; drop --processes or --incremental')
+    if arguments.tile_size:
+        grid, directions = load_tiled(
+            resolution=arguments.resolution,
+            tile_size=arguments.tile_size,
+            directory=arguments.tile_directory,
+            rng=np.random.default_rng(arguments.seed),
+            dtype=PRECISIONS[arguments.precision],
+        )
+    else:
+        # A resumed run replaces the owners with the checkpoint's, so the
+        # coarse levels would only be solved to be thrown away.
+        grid, directions = coarse_to_fine(
+            levels=() if arguments.resume else arguments.levels,
+            resolution=arguments.resolution,
+            rng=np.random.default_rng(arguments.seed),
+            steps=arguments.level_steps,
+            convergence=lambda: Convergence(
+                flips=arguments.flip_threshold,
+                score=arguments.score_threshold,
+                patience=arguments.patience,
+            ),
+            quiet=arguments.quiet,
+            dtype=PRECISIONS[arguments.precision],
+        )
+
+    start = restore(grid, load_checkpoint(arguments.resume)) if arguments.resume else 0
+    writer = CheckpointWriter(grid, arguments.checkpoint) if arguments.checkpoint else None
+    trajectory = TrajectoryWriter(
+        path=arguments.trajectory,
+        owners=grid.owners,
+        facility_names=(facility.name for facility in grid.facilities),
+        colors=(facility.color for facility in grid.facilities),
+        keyframe_interval=arguments.keyframe_interval,
+        resolution=arguments.resolution,
+        first_step=start,
+    ) if arguments.trajectory else None
+
+    pool = StripePool(
+        layers=grid.layers,
+        table=grid.table,
+        processes=arguments.processes,
+        dtype=grid.dtype,
+    ) if arguments.processes > 1 else None
+    profile = open(arguments.profile, 'w') if arguments.profile else None
+    if profile is not None:
+        grid.profiler.add_hook(JsonLines(profile))
+
+    convergence = Convergence(
+        flips=arguments.flip_threshold,
+        score=arguments.score_threshold,
+        patience=arguments.patience,
+    )
+    scores = []
+    flips = []
+    try:
+        for step, (style, score, flip_count) in enumerate(simulate(
+            grid=grid,
+            directions=directions,
+            styles=(
+                int(grid.rng.choice(PROPAGATION_STYLE_CHOICES)) if arguments.style is None else arguments.style
+                for _ in range(arguments.steps)
+            ),
+            convergence=convergence if arguments.until_stable else None,
+            synchronous=arguments.synchronous,
+            pool=pool,
+            incremental=arguments.incremental,
+        ), start):
+            scores.append(score)
+            flips.append(flip_count)
+            if not arguments.quiet:
+                print(step, score, flip_count)
+            if trajectory is not None:
+                trajectory.append(grid.changed, grid.owners[grid.changed], style=style, score=score)
+            if writer is not None and arguments.checkpoint_every and (step + 1) % arguments.checkpoint_every == 0:
+                writer.save(step + 1)
+        if arguments.anneal:
+            before = grid.owners.copy()
+            score = Annealer(
+                grid=grid,
+                temperature=arguments.temperature,
+                cooling=arguments.cooling,
+            ).anneal(arguments.anneal)
+            if not arguments.quiet:
+                print('anneal', arguments.anneal, score, grid.profiler.last['counters']['accepted'])
+            if trajectory is not None:
+                changed = np.nonzero(grid.owners != before)
+                trajectory.append(changed, grid.owners[changed], style=None, score=score)
+        if writer is not None:
+            writer.save(start + len(scores), wait=True)
+    finally:
+        if writer is not None:
+            writer.close()
+        if trajectory is not None:
+            trajectory.close()
+        if pool is not None:
+            pool.close()
+        if profile is not None:
+            profile.close()
+
+    if arguments.out:
+        np.savez_compressed(
+            arguments.out,
+            owners=grid.owners,
+            facilities=np.array([facility.name for facility in grid.facilities]),
+            scores=np.array(scores),
+            flips=np.array(flips),
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+'''
+Varies facility parameters and scoring constants one at a time, runs
+every variant to convergence in parallel and writes how the placement
+responds to each, e.g.
+
+    python sweep.py --parameters solar_reduction percent_solar penalty --factors 0.5 0.9 1.1 2 --out sensitivity.csv
+'''
+from argparse import ArgumentParser
+from csv import DictWriter
+from multiprocessing import Pool
+from os import cpu_count
+
+from constants import (
+    VALUES_PATH,
+    VALUES_SHEETNAMES,
+    CACHE_DIRECTORY,
+    FACILITIES,
+    IMAGE_DATA,
+    RESOLUTION,
+    DIRECTIONS_PATH,
+    DIRECTIONS_SHEET,
+)
+from headless import (
+    MIXED,
+    Task,
+    attach,
+    run,
+)
+from library.components import EMPTY
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.store import publish
+from library.sweep import (
+    SWEEP_NAMES,
+    sensitivity,
+    static_owners,
+    variant_table,
+    variants,
+)
+from utils import (
+    get_directions,
+    initialize,
+)
+from utils.workbook import load_parameters
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description='Measure how the placement responds to every parameter.')
+    parser.add_argument(
+        '--parameters',
+        nargs='+',
+        choices=SWEEP_NAMES,
+        default=list(SWEEP_NAMES),
+        help='facility parameters and scoring constants to vary',
+    )
+    parser.add_argument(
+        '--factors',
+        type=float,
+        nargs='+',
+        default=[0.8, 1.2],
+        help='factors every parameter is scaled by, one variant each',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='seed of every run')
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--resolution', type=int, default=RESOLUTION)
+    parser.add_argument('--processes', type=int, default=cpu_count())
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--flip-threshold', type=int, default=0)
+    parser.add_argument('--score-threshold', type=float, default=None)
+    parser.add_argument('--patience', type=int, default=len(PROPAGATION_STYLE_CHOICES))
+    parser.add_argument('--out', default=None, help='.csv file to write the sensitivity table to')
+    parser.add_argument('--quiet', action='store_true')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    sweep = variants(arguments.parameters, arguments.factors)
+    grid, _ = initialize(
+        facility_parameters=load_parameters(
+            workbook_path=VALUES_PATH,
+            sheetnames=VALUES_SHEETNAMES,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+        facilities=FACILITIES,
+        image_data=IMAGE_DATA,
+        resolution=arguments.resolution,
+        cache_directory=CACHE_DIRECTORY,
+    )
+    # Every variant starts from the same seed, so runs only differ by
+    # the parameter varied. Building the tables first rejects factors
+    # the scores are undefined for before anything runs.
+    tasks = [
+        Task(
+            seed=arguments.seed,
+            style=MIXED,
+            steps=arguments.steps,
+            flip_threshold=arguments.flip_threshold,
+            score_threshold=arguments.score_threshold,
+            patience=arguments.patience,
+            incremental=arguments.incremental,
+            table=variant_table(grid.table, variant),
+            tag=variant,
+        )
+        for variant in sweep
+    ]
+    mask = grid.owners != EMPTY
+    facility_names = tuple(facility.name for facility in grid.facilities)
+    static = dict(zip(sweep, static_owners(
+        facilities=grid.facilities,
+        table=grid.table,
+        sweep=sweep,
+        layers=grid.layers,
+        mask=mask,
+    )))
+    store = publish(
+        layers=grid.layers,
+        mask=mask,
+        directions=get_directions(
+            DIRECTIONS_PATH,
+            DIRECTIONS_SHEET,
+            grid.owners.shape[1],
+            grid.owners.shape[0],
+            arguments.resolution,
+            cache_directory=CACHE_DIRECTORY,
+        ),
+        facilities=grid.facilities,
+    )
+
+    outcomes = {}
+    with store, Pool(
+        arguments.processes,
+        initializer=attach,
+        initargs=(store.spec,),
+    ) as pool:
+        for outcome in pool.imap_unordered(run, tasks):
+            outcomes[outcome.task.tag] = outcome
+            if not arguments.quiet:
+                print(len(outcomes), *outcome.task.tag, outcome.steps, outcome.converged, outcome.score)
+
+    baseline = outcomes[sweep[0]]
+    table = [
+        sensitivity(
+            variant=variant,
+            score=outcomes[variant].score,
+            owners=outcomes[variant].owners,
+            static=static[variant],
+            baseline_score=baseline.score,
+            baseline_owners=baseline.owners,
+            baseline_static=static[sweep[0]],
+            facility_names=facility_names,
+        ) | dict(steps=outcomes[variant].steps, converged=outcomes[variant].converged)
+        for variant in sweep[1:]
+    ]
+    print('baseline', f'score={baseline.score}', f'steps={baseline.steps}', f'converged={baseline.converged}')
+    for parameter in arguments.parameters:
+        rows = [row for row in table if row['parameter'] == parameter]
+        print(parameter, *(
+            f"x{row['factor']}: elasticity={row['elasticity']:.4f} cells_changed={row['cells_changed']:.4f}"
+            for row in rows
+        ), sep='\n    ')
+    if arguments.out:
+        with open(arguments.out, 'w', newline='') as file:
+            writer = DictWriter(file, fieldnames=tuple(table[0]) if table else ('parameter', 'factor'))
+            writer.writeheader()
+            writer.writerows(table)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+from hashlib import sha256
+from os import getpid, makedirs, path, replace
+from typing import Callable
+
+def file_hash(file_path: str):
+    digest = sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_path(
+    cache_directory: str,
+    source_path: str,
+    *key,
+    extension: str = 'npy',
+):
+    name = path.splitext(path.basename(source_path))[0]
+    return path.join(
+        cache_directory,
+        '-'.join((name, file_hash(source_path)[:16], *(str(part) for part in key))) + f'.{extension}',
+    )
+
+def write_atomically(file_path: str, write: Callable):
+    makedirs(path.dirname(file_path) or '.', exist_ok=True)
+    partial_path = f'{file_path}.{getpid()}.partial'
+    with open(partial_path, 'wb') as file:
+        write(file)
+    replace(partial_path, file_path)
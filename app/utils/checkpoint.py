@@ -0,0 +1,122 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import deepcopy
+from hashlib import sha256
+from json import dumps, loads
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from library import Grid
+from library.scoring import PARAMETER_NAMES
+
+from .cache import write_atomically
+
+class Checkpoint(NamedTuple):
+    step: int
+    owners: np.ndarray
+    rng_state: dict
+    parameters_hash: str
+    maps_hash: str
+
+def grid_hashes(grid: Grid):
+    '''
+    Hashes of the facility parameter table and of the map layers of
+    `grid`, stored with checkpoints so they are only resumed on the same
+    inputs.
+    '''
+    parameters = sha256()
+    for name in PARAMETER_NAMES:
+        parameters.update(np.ascontiguousarray(getattr(grid.table, name), dtype=np.float64).tobytes())
+    maps = sha256()
+    for name in sorted(grid.layers):
+        maps.update(name.encode())
+        maps.update(np.ascontiguousarray(grid.layers[name], dtype=np.float64).tobytes())
+    return parameters.hexdigest(), maps.hexdigest()
+
+def capture(
+    grid: Grid,
+    step: int,
+    hashes: Optional[tuple[str, str]] = None,
+):
+    parameters_hash, maps_hash = grid_hashes(grid) if hashes is None else hashes
+    return Checkpoint(
+        step=step,
+        owners=grid.owners.copy(),
+        rng_state=deepcopy(grid.rng.bit_generator.state),
+        parameters_hash=parameters_hash,
+        maps_hash=maps_hash,
+    )
+
+def save_checkpoint(path: str, checkpoint: Checkpoint):
+    write_atomically(
+        path,
+        lambda file: np.savez_compressed(
+            file,
+            step=checkpoint.step,
+            owners=checkpoint.owners,
+            rng_state=dumps(checkpoint.rng_state),
+            parameters_hash=checkpoint.parameters_hash,
+            maps_hash=checkpoint.maps_hash,
+        ),
+    )
+
+def load_checkpoint(path: str):
+    with np.load(path) as data:
+        return Checkpoint(
+            step=int(data['step']),
+            owners=data['owners'],
+            rng_state=loads(str(data['rng_state'])),
+            parameters_hash=str(data['parameters_hash']),
+            maps_hash=str(data['maps_hash']),
+        )
+
+def restore(grid: Grid, checkpoint: Checkpoint):
+    '''
+    Puts `grid` back in the state of `checkpoint`; raises ValueError if
+    the checkpoint was taken on other parameters or maps.
+    '''
+    parameters_hash, maps_hash = grid_hashes(grid)
+    if parameters_hash != checkpoint.parameters_hash:
+        raise ValueError('Checkpoint was taken with different facility parameters')
+    if maps_hash != checkpoint.maps_hash:
+        raise ValueError('Checkpoint was taken on different maps')
+    grid.load_owners(checkpoint.owners)
+    grid.rng.bit_generator.state = checkpoint.rng_state
+    return checkpoint.step
+
+class CheckpointWriter:
+    '''
+    Writes checkpoints of a grid on a background thread. The owners and
+    generator state are copied on `save`, so the step loop only waits for
+    the copy; a save requested while the previous one is still being
+    written is skipped unless `wait` is set.
+    '''
+    def __init__(self, grid: Grid, path: str):
+        self.grid = grid
+        self.path = path
+        self.hashes = grid_hashes(grid)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Optional[Future] = None
+
+    def save(self, step: int, wait: bool = False):
+        if self.pending is not None and not self.pending.done():
+            if not wait:
+                return False
+            self.pending.result()
+        self.pending = self.executor.submit(
+            save_checkpoint,
+            self.path,
+            capture(self.grid, step, self.hashes),
+        )
+        return True
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.pending is not None:
+            self.pending.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
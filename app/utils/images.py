@@ -0,0 +1,40 @@
+from os import path
+from typing import Optional
+
+import numpy as np
+from PIL.Image import open as open_image
+
+from .cache import (
+    cache_path,
+    write_atomically,
+)
+
+def decode_layer(
+    image_path: str,
+    band: int,
+    resolution: int,
+):
+    with open_image(image_path, 'r') as image:
+        pixels = np.asarray(image.getchannel(band))
+    return np.ascontiguousarray(pixels[::resolution, ::resolution])
+
+def load_layer(
+    image_path: str,
+    band: int,
+    resolution: int,
+    cache_directory: Optional[str] = None,
+):
+    '''
+    One band of an image sampled every `resolution` pixels. With a cache
+    directory the sampled raster is stored as .npy, keyed by the image's
+    hash, band and resolution, and later loads memory-map it.
+    '''
+    if cache_directory is None:
+        return decode_layer(image_path, band, resolution)
+    layer_path = cache_path(cache_directory, image_path, band, resolution)
+    if not path.exists(layer_path):
+        write_atomically(
+            layer_path,
+            lambda file: np.save(file, decode_layer(image_path, band, resolution)),
+        )
+    return np.load(layer_path, mmap_mode='r')
@@ -0,0 +1,229 @@
+from io import BytesIO
+from json import dumps, loads
+from os import fstat, path as os_path
+from struct import Struct
+from typing import Iterable, Optional
+
+import numpy as np
+
+MAGIC = b'FPTRAJ1\n'
+# Header of every chunk: payload length, first step, number of steps.
+CHUNK = Struct('<QII')
+LENGTH = Struct('<I')
+
+class TrajectoryWriter:
+    '''
+    Appends the cells changed by every step, as flat indices and new
+    owners, together with per-step metrics. Steps are grouped into
+    chunks of `keyframe_interval`; every chunk opens with the full owner
+    raster it starts from and is written compressed once complete.
+
+    Steps are numbered from `first_step`. A run resumed from a checkpoint
+    continues an existing file for the same grid: whatever it logged from
+    `first_step` on is superseded by the new chunks.
+    '''
+    def __init__(
+        self,
+        path: str,
+        owners: np.ndarray,
+        facility_names: Iterable[str],
+        colors: Iterable[tuple[int, int, int]],
+        keyframe_interval: int = 64,
+        resolution: Optional[int] = None,
+        first_step: int = 0,
+    ):
+        header = dict(
+            shape=owners.shape,
+            dtype=owners.dtype.str,
+            facilities=list(facility_names),
+            colors=[list(color) for color in colors],
+            keyframe_interval=keyframe_interval,
+            resolution=resolution,
+            first_step=first_step,
+        )
+        if first_step and os_path.exists(path):
+            with TrajectoryReader(path) as reader:
+                for key in ('shape', 'dtype', 'facilities'):
+                    if reader.header[key] != loads(dumps(header[key])):
+                        raise ValueError(f'{path} was logged for a different grid')
+                if not reader.first_step <= first_step <= len(reader):
+                    raise ValueError(f'{path} has no step {first_step} to continue from')
+                end = reader.end
+            # Drop a chunk cut short by an interrupted write before appending.
+            self.file = open(path, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, 'wb')
+            encoded = dumps(header).encode()
+            self.file.write(MAGIC + LENGTH.pack(len(encoded)) + encoded)
+        self.keyframe_interval = keyframe_interval
+        self.owners = owners.copy()
+        self.step = first_step
+        self.chunk_count = 0
+        self.start_chunk()
+
+    def start_chunk(self):
+        self.keyframe = self.owners.copy()
+        self.first_step = self.step
+        self.indices: list[np.ndarray] = []
+        self.values: list[np.ndarray] = []
+        self.metrics: list[dict] = []
+
+    def append(
+        self,
+        changed: tuple[np.ndarray, ...],
+        values: np.ndarray,
+        **metrics,
+    ):
+        indices = np.ravel_multi_index(changed, self.owners.shape).astype(np.int32)
+        self.owners.flat[indices] = values
+        self.indices.append(indices)
+        self.values.append(np.asarray(values, dtype=self.owners.dtype))
+        self.metrics.append(metrics)
+        self.step += 1
+        if len(self.indices) == self.keyframe_interval:
+            self.flush()
+
+    def flush(self):
+        # A run without steps still gets its keyframe.
+        if not self.indices and self.chunk_count:
+            return
+        buffer = BytesIO()
+        np.savez_compressed(
+            buffer,
+            keyframe=self.keyframe,
+            counts=np.array([indices.size for indices in self.indices], dtype=np.int32),
+            indices=np.concatenate([np.zeros(0, dtype=np.int32), *self.indices]),
+            values=np.concatenate([np.zeros(0, dtype=self.owners.dtype), *self.values]),
+            metrics=dumps(self.metrics),
+        )
+        payload = buffer.getvalue()
+        self.file.write(CHUNK.pack(len(payload), self.first_step, len(self.indices)) + payload)
+        self.file.flush()
+        self.chunk_count += 1
+        self.start_chunk()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+class Chunk:
+    def __init__(self, payload: bytes):
+        with np.load(BytesIO(payload)) as data:
+            self.keyframe = data['keyframe']
+            offsets = np.concatenate(([0], np.cumsum(data['counts'])))
+            indices = data['indices']
+            values = data['values']
+            self.metrics = loads(str(data['metrics']))
+        self.diffs = tuple(
+            (indices[start:stop], values[start:stop])
+            for start, stop in zip(offsets[:-1], offsets[1:])
+        )
+
+class TrajectoryReader:
+    '''
+    Random access to a trajectory file. Chunk headers are indexed on
+    open; state(step) decompresses the one chunk holding that step and
+    applies its diffs from the keyframe on.
+    '''
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a trajectory file')
+        (length,) = LENGTH.unpack(self.file.read(LENGTH.size))
+        self.header = loads(self.file.read(length))
+        self.shape = tuple(self.header['shape'])
+        self.first_step = self.header.get('first_step', 0)
+        self.resolution = self.header.get('resolution')
+        self.chunks: list[tuple[int, int, int, int]] = []
+        size = fstat(self.file.fileno()).st_size
+        self.end = self.file.tell()
+        while True:
+            head = self.file.read(CHUNK.size)
+            if len(head) < CHUNK.size:
+                break
+            length, first_step, count = CHUNK.unpack(head)
+            if self.file.tell() + length > size:
+                # Chunk cut short by an interrupted write.
+                break
+            # A resumed run supersedes the steps logged from its start on.
+            while self.chunks and self.chunks[-1][0] >= first_step:
+                self.chunks.pop()
+            if self.chunks and sum(self.chunks[-1][:2]) > first_step:
+                previous_step, _, offset, previous_length = self.chunks[-1]
+                self.chunks[-1] = (previous_step, first_step - previous_step, offset, previous_length)
+            self.chunks.append((first_step, count, self.file.tell(), length))
+            self.file.seek(length, 1)
+            self.end = self.file.tell()
+        self.cached: Optional[tuple[int, Chunk]] = None
+
+    def __len__(self):
+        if not self.chunks:
+            return self.first_step
+        first_step, count, _, _ = self.chunks[-1]
+        return first_step + count
+
+    def chunk(self, number: int):
+        if self.cached is None or self.cached[0] != number:
+            _, _, offset, length = self.chunks[number]
+            self.file.seek(offset)
+            self.cached = (number, Chunk(self.file.read(length)))
+        return self.cached[1]
+
+    def locate(self, step: int):
+        if not self.first_step <= step <= len(self):
+            raise IndexError(f'Step {step} is outside of {self.first_step}..{len(self)}')
+        starts = [first_step for first_step, _, _, _ in self.chunks]
+        return max(0, int(np.searchsorted(starts, step, side='right')) - 1)
+
+    def state(self, step: int):
+        '''
+        Owners after `step` steps, i.e. before step `step` is applied.
+        '''
+        number = self.locate(step)
+        chunk = self.chunk(number)
+        owners = chunk.keyframe.copy()
+        for indices, values in chunk.diffs[:step - self.chunks[number][0]]:
+            owners.flat[indices] = values
+        return owners
+
+    def frames(self, start: Optional[int] = None):
+        '''
+        Yields the step number and a fresh owner raster for every state
+        from `start`, by default the first logged, to the end.
+        '''
+        start = self.first_step if start is None else start
+        owners = self.state(start)
+        yield start, owners
+        step = start
+        while step < len(self):
+            number = self.locate(step)
+            chunk = self.chunk(number)
+            indices, values = chunk.diffs[step - self.chunks[number][0]]
+            owners = owners.copy()
+            owners.flat[indices] = values
+            step += 1
+            yield step, owners
+
+    def metrics(self):
+        return [
+            metrics
+            for number, (_, count, _, _) in enumerate(self.chunks)
+            for metrics in self.chunk(number).metrics[:count]
+        ]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,99 @@
+from os import path
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+from openpyxl import load_workbook
+
+from library.directions import Directions
+
+from .cache import (
+    cache_path,
+    write_atomically,
+)
+
+class FacilityParameters(NamedTuple):
+    names: tuple[str, ...]
+    columns: dict[str, np.ndarray]
+
+def read_parameters(path: str, *sheetnames):
+    '''
+    Streams the facility sheets of a workbook, reading rows until the
+    first one without a facility name, and merges their columns.
+    '''
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    names: list[str] = []
+    values: dict[str, dict[str, float]] = {}
+    for sheetname in sheetnames:
+        rows = workbook[sheetname].iter_rows(values_only=True)
+        headers = next(rows)
+        for row in rows:
+            if row[0] is None:
+                break
+            if row[0] not in values:
+                names.append(row[0])
+                values[row[0]] = {}
+            for header, value in zip(headers[1:], row[1:]):
+                values[row[0]][header] = float(value)
+    workbook.close()
+    headers = tuple(dict.fromkeys(header for name in names for header in values[name]))
+    return FacilityParameters(
+        names=tuple(names),
+        columns=dict(
+            (header, np.array([values[name].get(header, np.nan) for name in names]))
+            for header in headers
+        ),
+    )
+
+def read_directions(path: str, sheet: str):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    directions = Directions.from_rows(workbook[sheet].iter_rows(values_only=True))
+    workbook.close()
+    return directions
+
+def load_parameters(
+    workbook_path: str,
+    sheetnames: Iterable[str],
+    cache_directory: Optional[str] = None,
+):
+    '''
+    `read_parameters` compiled into an .npz bundle next to the other cached
+    inputs; the bundle is keyed by the workbook's hash, so editing the
+    workbook rebuilds it.
+    '''
+    sheetnames = tuple(sheetnames)
+    if cache_directory is None:
+        return read_parameters(workbook_path, *sheetnames)
+    bundle_path = cache_path(cache_directory, workbook_path, *sheetnames, extension='npz')
+    if not path.exists(bundle_path):
+        parameters = read_parameters(workbook_path, *sheetnames)
+        write_atomically(
+            bundle_path,
+            lambda file: np.savez(
+                file,
+                names=np.array(parameters.names),
+                headers=np.array(tuple(parameters.columns)),
+                values=np.array(tuple(parameters.columns.values())).reshape(-1, len(parameters.names)),
+            ),
+        )
+    with np.load(bundle_path) as bundle:
+        return FacilityParameters(
+            names=tuple(bundle['names'].tolist()),
+            columns=dict(zip(bundle['headers'].tolist(), bundle['values'])),
+        )
+
+def load_directions(
+    workbook_path: str,
+    sheet: str,
+    cache_directory: Optional[str] = None,
+):
+    if cache_directory is None:
+        return read_directions(workbook_path, sheet)
+    bundle_path = cache_path(cache_directory, workbook_path, sheet, extension='npz')
+    if not path.exists(bundle_path):
+        directions = read_directions(workbook_path, sheet)
+        write_atomically(
+            bundle_path,
+            lambda file: np.savez(file, ids=directions.ids, labels=np.array(directions.labels, dtype=np.str_)),
+        )
+    with np.load(bundle_path) as bundle:
+        return Directions(ids=bundle['ids'], labels=tuple(bundle['labels'].tolist()))
@@ -0,0 +1,245 @@
+'''
+Checks the vectorized scoring path against the Decimal formulas of
+Facility.score on sampled cells, for every floating point precision, e.g.
+
+    python validate.py --samples 500 --steps 20 --out accuracy.json
+    python validate.py --synthetic 1000x822 --precisions float32
+'''
+from argparse import ArgumentParser
+from decimal import Decimal
+from itertools import combinations
+from json import dumps
+from typing import Optional
+
+import numpy as np
+
+from constants import (
+    VALUES_PATH,
+    VALUES_SHEETNAMES,
+    CACHE_DIRECTORY,
+    FACILITIES,
+    IMAGE_DATA,
+    RESOLUTION,
+    ATTACK_DIRECTIONS,
+    DIRECTIONS_PATH,
+    DIRECTIONS_SHEET,
+)
+from benchmark import (
+    parse_size,
+    synthetic_directions,
+    synthetic_maps,
+    synthetic_parameters,
+)
+from library import (
+    Facility,
+    Grid,
+)
+from library.components import (
+    EMPTY,
+    ComponentTable,
+)
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.scoring import (
+    PRECISIONS,
+    as_layers,
+    score_raster,
+)
+from utils import (
+    assign_parameters,
+    get_directions,
+    initialize,
+)
+from utils.workbook import load_parameters
+
+def load(
+    resolution: int,
+    synthetic: Optional[tuple[int, int]],
+    rng: np.random.Generator,
+):
+    if synthetic is None:
+        grid, named_maps = initialize(
+            facility_parameters=load_parameters(
+                workbook_path=VALUES_PATH,
+                sheetnames=VALUES_SHEETNAMES,
+                cache_directory=CACHE_DIRECTORY,
+            ),
+            facilities=FACILITIES,
+            image_data=IMAGE_DATA,
+            resolution=resolution,
+            cache_directory=CACHE_DIRECTORY,
+            rng=rng,
+        )
+        directions = get_directions(
+            DIRECTIONS_PATH,
+            DIRECTIONS_SHEET,
+            grid.owners.shape[1],
+            grid.owners.shape[0],
+            resolution,
+            cache_directory=CACHE_DIRECTORY,
+        )
+        return grid, named_maps, directions
+
+    width, height = synthetic
+    maps = synthetic_maps(width, height, rng)
+    named_maps = dict(
+        (name, np.ascontiguousarray(layer[::resolution, ::resolution]))
+        for name, layer in maps.items()
+    )
+    parameters = synthetic_parameters(len(FACILITIES), rng)
+    facilities = tuple(
+        Facility(name=name, color=tuple(int(value) for value in rng.integers(256, size=3)))
+        for name in parameters.names
+    )
+    assign_parameters(facilities, parameters)
+    mask = np.logical_or.reduce([layer != 0 for layer in named_maps.values()])
+    grid = Grid(
+        named_maps=named_maps,
+        mask=mask,
+        facilities=facilities,
+        rng=rng,
+    )
+    return grid, named_maps, synthetic_directions(mask.shape[1], mask.shape[0], rng)
+
+def reference_scores(
+    facilities: tuple[Facility, ...],
+    named_maps: dict[str, np.ndarray],
+    ys: np.ndarray,
+    xs: np.ndarray,
+    area: np.ndarray,
+    average_topography: np.ndarray,
+):
+    '''
+    Decimal scores of every facility on every sampled cell, as a
+    (facility, sample) list of lists.
+    '''
+    maps = dict((name, layer.tolist()) for name, layer in named_maps.items())
+    return [
+        [
+            facility.score(
+                named_maps=maps,
+                x=int(x),
+                y=int(y),
+                area=Decimal(int(cell_area)),
+                average_topography=Decimal(float(cell_topography)),
+            )
+            for x, y, cell_area, cell_topography in zip(xs, ys, area, average_topography)
+        ]
+        for facility in facilities
+    ]
+
+def order(a, b):
+    return (a > b) - (a < b)
+
+def compare(reference: list[list[Decimal]], scores: np.ndarray):
+    '''
+    Divergence of `scores` from the Decimal `reference`: the largest
+    absolute and relative errors, and how often the best facility of a
+    cell and the order of every pair of facilities on it agree.
+    '''
+    facility_count, sample_count = scores.shape
+    absolute = np.zeros(scores.shape)
+    relative = np.zeros(scores.shape)
+    for facility in range(facility_count):
+        for sample in range(sample_count):
+            expected = reference[facility][sample]
+            error = abs(Decimal(float(scores[facility, sample])) - expected)
+            absolute[facility, sample] = float(error)
+            relative[facility, sample] = float(error / abs(expected)) if expected else float(error)
+
+    best = 0
+    pairs = 0
+    for sample in range(sample_count):
+        expected = [reference[facility][sample] for facility in range(facility_count)]
+        actual = scores[:, sample].tolist()
+        best += max(range(facility_count), key=expected.__getitem__) == int(np.argmax(actual))
+        pairs += sum(
+            order(expected[i], expected[j]) == order(actual[i], actual[j])
+            for i, j in combinations(range(facility_count), 2)
+        )
+    pair_count = sample_count * facility_count * (facility_count - 1) // 2
+    return dict(
+        max_absolute_error=float(absolute.max(initial=0)),
+        max_relative_error=float(relative.max(initial=0)),
+        mean_relative_error=float(relative.mean()) if relative.size else 0.0,
+        best_facility_agreement=best / max(1, sample_count),
+        pairwise_order_agreement=pairs / max(1, pair_count),
+    )
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description='Compare the floating point scores against the Decimal formulas.')
+    parser.add_argument('--resolution', type=int, default=RESOLUTION)
+    parser.add_argument(
+        '--synthetic',
+        type=parse_size,
+        default=None,
+        help='score synthetic maps and parameters of this size in pixels, WxH, instead of the inputs',
+    )
+    parser.add_argument('--samples', type=int, default=200, help='number of occupied cells to sample')
+    parser.add_argument(
+        '--steps',
+        type=int,
+        default=10,
+        help='synchronous steps to take first, so regions have grown past single cells',
+    )
+    parser.add_argument(
+        '--precisions',
+        nargs='+',
+        choices=tuple(PRECISIONS),
+        default=list(PRECISIONS),
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='.json file to write the report to')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    rng = np.random.default_rng(arguments.seed)
+    grid, named_maps, directions = load(arguments.resolution, arguments.synthetic, rng)
+    for _ in range(arguments.steps):
+        grid.update(
+            attack_directions=ATTACK_DIRECTIONS,
+            directions=directions,
+            style=int(rng.choice(PROPAGATION_STYLE_CHOICES)),
+            synchronous=True,
+        )
+
+    components = ComponentTable(owners=grid.owners, topography=grid.layers['topography'])
+    ys, xs = np.nonzero(grid.owners != EMPTY)
+    chosen = np.sort(rng.choice(ys.size, size=min(arguments.samples, ys.size), replace=False))
+    ys, xs = ys[chosen], xs[chosen]
+    labels = components.labels[ys, xs]
+    area = components.area[labels]
+    average_topography = components.average_topography[labels]
+    reference = reference_scores(grid.facilities, named_maps, ys, xs, area, average_topography)
+
+    results = []
+    for precision in arguments.precisions:
+        dtype = PRECISIONS[precision]
+        layers = as_layers(
+            dict((name, layer[ys, xs]) for name, layer in named_maps.items()),
+            dtype,
+        )
+        scores = score_raster(
+            table=grid.table,
+            layers=layers,
+            area=area,
+            average_topography=average_topography,
+            dtype=dtype,
+        )[:, 0]
+        results.append(dict(precision=precision, **compare(reference, scores)))
+        print(*(f'{key}={value}' for key, value in results[-1].items()))
+    report = dict(
+        resolution=arguments.resolution,
+        synthetic=arguments.synthetic,
+        steps=arguments.steps,
+        samples=int(ys.size),
+        facilities=len(grid.facilities),
+        seed=arguments.seed,
+        results=results,
+    )
+    if arguments.out:
+        with open(arguments.out, 'w') as file:
+            file.write(dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+from os import path
+import sys
+
+# The scripts and the library are imported with app/ on the path, as
+# when run from it.
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'app'))
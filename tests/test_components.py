@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from library.components import (
+    EMPTY,
+    OWNER_DTYPE,
+    ComponentTable,
+)
+
+DIRECTION_COUNT = 3
+
+def assert_same_regions(table: ComponentTable, fresh: ComponentTable, owners: np.ndarray):
+    # Labels may differ, but must split the grid into the same regions
+    # with the same statistics.
+    occupied = owners != EMPTY
+    np.testing.assert_array_equal(table.labels == 0, ~occupied)
+    pairs = np.unique(np.stack((table.labels[occupied], fresh.labels[occupied])), axis=1)
+    assert pairs.shape[1] == np.unique(table.labels[occupied]).size == np.unique(fresh.labels[occupied]).size
+    labels, fresh_labels = table.labels[occupied], fresh.labels[occupied]
+    np.testing.assert_array_equal(table.owner[labels], owners[occupied])
+    np.testing.assert_array_equal(table.area[labels], fresh.area[fresh_labels])
+    np.testing.assert_allclose(table.topography_sum[labels], fresh.topography_sum[fresh_labels])
+    np.testing.assert_array_equal(table.histogram[labels], fresh.histogram[fresh_labels])
+    np.testing.assert_array_equal(table.bounds[labels], fresh.bounds[fresh_labels])
+    assert table.area.sum() == occupied.sum()
+
+@pytest.mark.parametrize('seed', range(40))
+def test_reassign_matches_fresh_table(seed):
+    rng = np.random.default_rng(seed)
+    facility_count = int(rng.integers(2, 5))
+    shape = tuple(int(size) for size in rng.integers(1, 16, size=2))
+    owners = rng.integers(facility_count, size=shape).astype(OWNER_DTYPE)
+    owners[rng.random(shape) < 0.2] = EMPTY
+    topography = rng.random(shape)
+    directions = rng.integers(DIRECTION_COUNT, size=shape, dtype=np.uint8)
+    table = ComponentTable(
+        owners=owners,
+        topography=topography,
+        directions=directions,
+        direction_count=DIRECTION_COUNT,
+    )
+
+    ys, xs = np.nonzero(owners != EMPTY)
+    for step in range(10):
+        if not ys.size:
+            break
+        flipped = rng.choice(ys.size, size=int(rng.integers(1, ys.size + 1)), replace=False)
+        flip_ys, flip_xs = ys[flipped], xs[flipped]
+        owners[flip_ys, flip_xs] = rng.integers(facility_count, size=flipped.size)
+        # reassign rebuilds the table once most of it changes; relabel
+        # never does.
+        if step % 2:
+            table.commit(table.relabel(owners, flip_ys, flip_xs))
+        else:
+            table.reassign(owners, flip_ys, flip_xs)
+        assert_same_regions(table, ComponentTable(
+            owners=owners,
+            topography=topography,
+            directions=directions,
+            direction_count=DIRECTION_COUNT,
+        ), owners)
+
+def test_direction_histogram_with_many_facilities():
+    # facility * direction_count passes the int8 owner range here.
+    rng = np.random.default_rng(0)
+    facility_count, direction_count = 20, 8
+    owners = rng.integers(facility_count, size=(30, 30)).astype(OWNER_DTYPE)
+    directions = rng.integers(direction_count, size=owners.shape, dtype=np.uint8)
+    table = ComponentTable(
+        owners=owners,
+        topography=np.zeros(owners.shape),
+        directions=directions,
+        direction_count=direction_count,
+    )
+    expected = np.zeros((facility_count, direction_count), dtype=np.int64)
+    np.add.at(expected, (owners.astype(np.int64), directions), 1)
+    np.testing.assert_array_equal(table.direction_histogram(facility_count), expected)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from library.components import (
+    EMPTY,
+    OWNER_DTYPE,
+)
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.propagation import (
+    POSITIONS,
+    cell_scores,
+    propagate,
+    propagate_at,
+    sweep,
+)
+
+def raster(seed: int):
+    '''
+    A small random grid with some empty cells, the scores of every
+    facility on it and an attack offset per facility. Every other seed
+    draws whole-number scores, so ties between facilities are common.
+    '''
+    rng = np.random.default_rng(seed)
+    facility_count = int(rng.integers(2, 6))
+    shape = tuple(int(size) for size in rng.integers(1, 12, size=2))
+    owners = rng.integers(facility_count, size=shape).astype(OWNER_DTYPE)
+    owners[rng.random(shape) < 0.2] = EMPTY
+    if seed % 2:
+        scores = rng.integers(4, size=(facility_count, *shape)).astype(np.float64)
+    else:
+        scores = rng.random((facility_count, *shape))
+    offsets = [position for position in POSITIONS if position != (0, 0)]
+    attack_offsets = tuple(offsets[i] for i in rng.integers(len(offsets), size=facility_count))
+    return owners, scores, attack_offsets
+
+@pytest.mark.parametrize('style', PROPAGATION_STYLE_CHOICES)
+@pytest.mark.parametrize('seed', range(40))
+def test_propagate_matches_sweep(seed, style):
+    owners, scores, attack_offsets = raster(seed)
+    expected = owners.tolist()
+    sweep(
+        owners=owners.tolist(),
+        scores=scores.tolist(),
+        attack_offsets=attack_offsets,
+        style=style,
+        rows=range(owners.shape[0]),
+        out=expected,
+    )
+    np.testing.assert_array_equal(propagate(owners, scores, attack_offsets, style), expected)
+
+    ys, xs = np.nonzero(np.ones(owners.shape, dtype=bool))
+    at = propagate_at(
+        owners=owners,
+        scores=cell_scores(owners, scores),
+        facility_count=scores.shape[0],
+        attack_offsets=attack_offsets,
+        style=style,
+        ys=ys,
+        xs=xs,
+    )
+    np.testing.assert_array_equal(at.reshape(owners.shape), expected)
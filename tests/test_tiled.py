@@ -0,0 +1,67 @@
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pytest
+
+from benchmark import (
+    synthetic_directions,
+    synthetic_maps,
+    synthetic_parameters,
+)
+from constants import ATTACK_DIRECTIONS
+from library import (
+    Facility,
+    Grid,
+)
+from library.constants import PROPAGATION_STYLE_CHOICES
+from library.tiled import TiledGrid
+from utils import assign_parameters
+
+def facilities(count: int, rng: np.random.Generator):
+    facilities = tuple(Facility(name=f'Facility {i}', color=(0, 0, 0)) for i in range(count))
+    assign_parameters(facilities, synthetic_parameters(count, rng))
+    return facilities
+
+@pytest.mark.parametrize('tile_size', [5, 16, 23, 64])
+def test_tiled_matches_grid(tile_size):
+    rng = np.random.default_rng(0)
+    named_maps = dict((name, layer[::10, ::10]) for name, layer in synthetic_maps(430, 370, rng).items())
+    table = facilities(6, rng)
+    directions = synthetic_directions(43, 37, rng)
+    # Every style twice, in random order.
+    styles = rng.permutation(PROPAGATION_STYLE_CHOICES * 2).tolist()
+
+    grid = Grid(
+        named_maps=named_maps,
+        mask=np.logical_or.reduce([layer != 0 for layer in named_maps.values()]),
+        facilities=table,
+        rng=np.random.default_rng(1),
+    )
+    with TemporaryDirectory() as directory:
+        tiled = TiledGrid(
+            named_maps=named_maps,
+            facilities=table,
+            directory=directory,
+            tile_size=tile_size,
+            rng=np.random.default_rng(1),
+        )
+        np.testing.assert_array_equal(tiled.owners, grid.owners)
+        for style in styles:
+            grid.update(attack_directions=ATTACK_DIRECTIONS, directions=directions, style=style, synchronous=True)
+            tiled.update(attack_directions=ATTACK_DIRECTIONS, directions=directions, style=style)
+            assert tiled.component_count == (grid.components.area > 0).sum()
+            np.testing.assert_array_equal(tiled.owners, grid.owners)
+        del tiled
+
+def test_every_facility_blacklisted(monkeypatch):
+    rng = np.random.default_rng(0)
+    named_maps = dict((name, layer[::10, ::10]) for name, layer in synthetic_maps(100, 100, rng).items())
+    table = facilities(3, rng)
+    monkeypatch.setattr('library.BLACKLIST', set(facility.name for facility in table))
+    with pytest.raises(ValueError, match='BLACKLIST'):
+        Grid(
+            named_maps=named_maps,
+            mask=np.logical_or.reduce([layer != 0 for layer in named_maps.values()]),
+            facilities=table,
+            rng=np.random.default_rng(1),
+        )